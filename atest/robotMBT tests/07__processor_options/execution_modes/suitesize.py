@@ -0,0 +1,20 @@
+class suitesize:
+    """
+    Records the number of tests present in the running suite at the start of each test.
+    In online mode, this number grows while the suite is running.
+    """
+    ROBOT_LIBRARY_SCOPE = 'GLOBAL'
+    ROBOT_LISTENER_API_VERSION = 3
+
+    def __init__(self):
+        self.ROBOT_LIBRARY_LISTENER = self
+        self.sizes = []
+
+    def _start_test(self, data, result):
+        self.sizes.append(len(data.parent.tests))
+
+    def number_of_tests_known_at_first_test(self):
+        return self.sizes[0]
+
+    def number_of_tests_known_at_last_test(self):
+        return self.sizes[-1]
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2026, J. Foederer
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import itertools
+import random
+from collections import Counter
+from typing import Any
+
+from .substitutionmap import Constraint, SubstitutionMap, _maximum_matching
+
+# A covered combination: (scenario index, ((example value, value), ...))
+DataTuple = tuple[int, tuple[tuple[str, Any], ...]]
+
+
+def parse_data_coverage(option: str | int) -> int:
+    """Translates the data_coverage option into the interaction strength t. 0 means off."""
+    option = str(option).strip().lower().replace(' ', '')
+    if option in ('', '0', 'none'):
+        return 0
+    if option == 'pairwise':
+        return 2
+    if option.startswith('t=') and option[2:].isdigit() and int(option[2:]) > 0:
+        return int(option[2:])
+    raise ValueError(f"Invalid value for data_coverage: '{option}'. Use pairwise or t=<number>, e.g. t=3")
+
+
+class DataCoverage:
+    """
+    Tracks t-wise coverage of the values that modifiers choose for the example values in each
+    scenario. The targets are all combinations of t example values and their options that
+    can occur in a valid solution. Option sets can differ depending on the model's state, so
+    targets are collected from each scenario variant that is added to the trace. Targets are
+    only collected while coverage is required, covered combinations are tracked all the time.
+    """
+
+    def __init__(self, strength: int):
+        self.strength: int = strength
+        self.required: bool = False  # When False, coverage is tracked, but not needed for completion
+        self._targets: Counter[DataTuple] = Counter()
+        self._covered: Counter[DataTuple] = Counter()
+        self._uses: Counter[tuple[int, str, Any]] = Counter()  # Covered combinations per option
+        self._n_uncovered: int = 0
+        self._target_cache: dict[tuple, frozenset[DataTuple]] = {}
+
+    @property
+    def complete(self) -> bool:
+        return self._n_uncovered == 0
+
+    @property
+    def status(self) -> tuple[int, int]:
+        """Returns the number of covered targets and the total number of targets"""
+        return len(self._targets) - self._n_uncovered, len(self._targets)
+
+    def tuples_for(self, index: int, subs: SubstitutionMap) -> tuple[frozenset[DataTuple], frozenset[DataTuple]]:
+        """
+        Returns the targets and the covered combinations for a scenario variant. The targets
+        are empty while coverage is not required.
+        """
+        options = {example_value: tuple(constraint.optionset)
+                   for example_value, constraint in sorted(subs.substitutions.items())
+                   if isinstance(constraint, Constraint)}
+        targets = frozenset()
+        if self.required:
+            key = (index, tuple(options.items()))
+            if key not in self._target_cache:
+                self._target_cache[key] = self._feasible_tuples(index, options)
+            targets = self._target_cache[key]
+        return targets, self.solution_tuples(index, subs.solution, options)
+
+    def solution_tuples(self, index: int, solution: dict[str, Any], options: dict[str, Any]) -> frozenset[DataTuple]:
+        names = [example_value for example_value in options if example_value in solution]
+        if not names:
+            return frozenset()
+        return frozenset((index, tuple((name, solution[name]) for name in combination))
+                         for combination in itertools.combinations(names, min(self.strength, len(names))))
+
+    def _feasible_tuples(self, index: int, options: dict[str, tuple]) -> frozenset[DataTuple]:
+        """
+        Returns all combinations of t options that are part of a solution. The options form a
+        solvable map, so the other example values have a matching of their own. A combination
+        can only be infeasible if it takes values from that matching. Only then the others are
+        matched again, without these values.
+        """
+        targets = set()
+        if not options:
+            return frozenset()
+        for combination in itertools.combinations(options, min(self.strength, len(options))):
+            others = [name for name in options if name not in combination]
+            matching = _maximum_matching({name: options[name] for name in others})
+            matched = set(matching.values())
+            for pairs in itertools.product(*([(name, opt) for opt in options[name]] for name in combination)):
+                values = {value for _, value in pairs}
+                if len(values) < len(pairs):
+                    continue  # example values always get unique values
+                if not matched.isdisjoint(values) and not _matchable_without(values, matching, options):
+                    continue
+                targets.add((index, pairs))
+        return frozenset(targets)
+
+    def add(self, targets: frozenset[DataTuple], covered: frozenset[DataTuple]) -> bool:
+        """Registers a scenario variant. Returns True if it covers a combination that was not covered yet."""
+        for target in targets:
+            self._targets[target] += 1
+            if self._targets[target] == 1 and not self._covered[target]:
+                self._n_uncovered += 1
+        new_coverage = False
+        for combination in covered:
+            self._covered[combination] += 1
+            if self._covered[combination] == 1:
+                new_coverage = True  # Always a target when required, a solution is feasible by definition
+                for name, value in combination[1]:
+                    self._uses[(combination[0], name, value)] += 1
+                if self._targets[combination]:
+                    self._n_uncovered -= 1
+        return new_coverage
+
+    def remove(self, targets: frozenset[DataTuple], covered: frozenset[DataTuple]):
+        """Reverts add(), when rewinding the trace"""
+        for combination in covered:
+            self._covered[combination] -= 1
+            if not self._covered[combination]:
+                for name, value in combination[1]:
+                    self._uses[(combination[0], name, value)] -= 1
+                if self._targets[combination]:
+                    self._n_uncovered += 1
+        for target in targets:
+            self._targets[target] -= 1
+            if not self._targets[target]:
+                del self._targets[target]
+                if not self._covered[target]:
+                    self._n_uncovered -= 1
+
+    def select_solution(self, index: int, subs: SubstitutionMap):
+        """
+        Solves the substitution map greedily, like covering array generators such as AETG do.
+        Each example value gets the option that completes the most combinations that are not
+        covered yet. Between equal options, the one in the fewest covered combinations wins.
+        Raises ValueError if there is no solution.
+        """
+        position = {example_value: i for i, (example_value, constraint) in
+                    enumerate(sorted(subs.substitutions.items())) if isinstance(constraint, Constraint)}
+        size = min(self.strength, len(position))
+
+        def choose(example_value: str, options: list[Any], partial: dict[str, Any]) -> Any:
+            chosen = sorted((name for name in partial if name in position), key=position.get)
+            combinations = [sorted((*others, example_value), key=position.get)
+                            for others in itertools.combinations(chosen, size - 1)]
+
+            def score(value: Any) -> tuple[int, int]:
+                solution = {**partial, example_value: value}
+                gain = sum(1 for combination in combinations
+                           if not self._covered[(index, tuple((name, solution[name]) for name in combination))])
+                return gain, -self._uses[(index, example_value, value)]
+            return max(random.sample(options, len(options)), key=score)
+
+        subs.solve(choose)
+
+
+def _matchable_without(values: set[Any], matching: dict[str, Any], options: dict[str, tuple]) -> bool:
+    """
+    Checks whether the matched example values can all do without the given values. Usually a
+    free alternative option is at hand for the few that lose their match. Only if not, a new
+    maximum matching is needed.
+    """
+    taken = set(matching.values()).union(values)
+    for name, value in matching.items():
+        if value in values:
+            alternative = next((opt for opt in options[name] if opt not in taken), None)
+            if alternative is None:
+                remaining = {name: [opt for opt in options[name] if opt not in values] for name in matching}
+                return len(_maximum_matching(remaining)) == len(remaining)
+            taken.add(alternative)
+    return True
@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2026, J. Foederer
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import ast
+import builtins
+import re
+from typing import Iterator
+
+from .modeller import _relevant_expressions, get_modifier_plan
+from .modelspace import ModelSpace
+from .steparguments import StepArguments
+from .suitedata import Scenario, Step
+from .tracestate import TraceState
+
+ANY = '*'  # Wildcard for domain terms and attributes that are only known at run time
+PLACEHOLDER = '__robot_arg__'  # Replaces ${...} arguments, whose values are only known at run time
+
+# A model item is a domain term (term, None), or an attribute of a domain term (term, attribute)
+Item = tuple[str, str | None]
+
+
+class ExpressionInfo:
+    """The model items that a single :IN: or :OUT: expression needs, and the ones it provides"""
+
+    def __init__(self, expression: str):
+        self.expression: str = expression
+        self.needs: list[Item] = []
+        self.provides: list[Item] = []
+        self.names: set[str] = set()  # All names the expression refers to, including aliases and scenario
+        self.reads: set[Item] = set()  # Model items that the result depends on, excluding the scenario scope
+        self.writes: set[Item] = set()  # Model items that evaluation can modify, excluding the scenario scope
+        self.is_condition: bool = False  # Whether the expression has a value, which could be False
+        expr = re.sub(r'[$@&%]\{[^}]*\}', PLACEHOLDER, expression.strip())
+        if ModelSpace._is_new_vocab_expression(expr):
+            term = ModelSpace._vocab_term(expr)
+            self.provides.append((self._term(term), None))
+            self.names.add(self._term(term))
+            self.writes.add((self._term(term), None))
+        elif ModelSpace._is_del_vocab_expression(expr):
+            self._need(ModelSpace._vocab_term(expr), None)
+            self.names.add(self._term(ModelSpace._vocab_term(expr)))
+            self.writes.add((self._term(ModelSpace._vocab_term(expr)), None))
+        else:
+            try:
+                tree = ast.parse(expr)
+            except SyntaxError:
+                self.writes.add((ANY, None))  # Errors like these are reported when the expression is evaluated
+                return
+            self.is_condition = len(tree.body) == 1 and isinstance(tree.body[0], ast.Expr)
+            self._analyse(tree)
+
+    def _analyse(self, tree: ast.AST):
+        local_names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)
+                       and isinstance(node.ctx, ast.Store)}
+        local_names |= {node.arg for node in ast.walk(tree) if isinstance(node, ast.arg)}
+        self.names |= {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and node.id
+                       not in local_names | {PLACEHOLDER} and not hasattr(builtins, node.id)}
+        self._find_effects(tree, local_names)
+        body = tree.body
+        if len(body) == 1 and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Name):
+            # A bare name is an existence check for a domain term
+            self._need(body[0].value.id, None)
+            return
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'setattr':
+                self.provides.append((ANY, ANY))
+                self.names.add(ANY)
+            if not isinstance(node, ast.Attribute) or node.attr.startswith('__'):
+                continue
+            base = node.value
+            is_term = isinstance(base, ast.Name) and base.id not in local_names
+            if isinstance(base, ast.Name) and base.id == PLACEHOLDER:
+                self.names.add(ANY)
+            if isinstance(node.ctx, ast.Load):
+                if is_term:
+                    self._need(base.id, node.attr)
+            else:
+                term = self._term(base.id) if is_term else ANY
+                attr = ANY if node.attr == PLACEHOLDER else node.attr
+                if is_term:
+                    self._need(base.id, None)
+                self.provides.append((term, attr))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Attribute):
+                base = node.target.value
+                if isinstance(base, ast.Name) and base.id not in local_names:
+                    self._need(base.id, node.target.attr)
+
+    def _find_effects(self, tree: ast.AST, local_names: set[str]):
+        def item(node: ast.Attribute) -> Item:
+            base = node.value
+            term = base.id if isinstance(base, ast.Name) and base.id not in local_names else ANY
+            return self._term(term), ANY if node.attr == PLACEHOLDER else node.attr
+
+        def modified_item(node: ast.AST) -> Item | None:
+            # The attribute holding the object that is modified, like card.names in card.names[0].append()
+            while isinstance(node, (ast.Subscript, ast.Call, ast.Attribute)):
+                if isinstance(node, ast.Attribute):
+                    return item(node)
+                node = node.value if isinstance(node, ast.Subscript) else node.func
+            if isinstance(node, ast.Name) and node.id in local_names:
+                return ANY, ANY  # A local name can refer to any object from the model
+            return None
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name):
+                if node.id not in local_names | {PLACEHOLDER, 'scenario'} and not hasattr(builtins, node.id):
+                    self.reads.add((node.id, None))
+            elif isinstance(node, ast.Attribute) and item(node)[0] != 'scenario':
+                (self.reads if isinstance(node.ctx, ast.Load) else self.writes).add(item(node))
+            if isinstance(node, ast.Call):
+                if isinstance(node.func, ast.Name) and node.func.id in ('setattr', 'delattr'):
+                    self.writes.add((ANY, ANY))
+                elif isinstance(node.func, ast.Attribute):
+                    target = modified_item(node.func.value)
+                    if target is not None and target[0] != 'scenario':
+                        self.writes.add(target)
+            elif isinstance(node, ast.Subscript) and not isinstance(node.ctx, ast.Load):
+                target = modified_item(node.value)
+                if target is not None and target[0] != 'scenario':
+                    self.writes.add(target)
+
+    @staticmethod
+    def _term(name: str) -> str:
+        return ANY if name == PLACEHOLDER else name
+
+    def _need(self, name: str, attr: str | None):
+        if name in (PLACEHOLDER, 'scenario') or hasattr(builtins, name) or attr in dir(ModelSpace):
+            return  # Known only at run time, or not part of the domain model
+        if attr == PLACEHOLDER:
+            attr = ANY
+        self.needs.append((name, None))
+        if attr:
+            self.needs.append((name, attr))
+
+
+def _affects(written: Item, used: Item) -> bool:
+    """Whether writing the first item can change the outcome of reading or writing the second"""
+    (written_term, written_attr), (used_term, used_attr) = written, used
+    if written_term != used_term and ANY not in (written_term, used_term):
+        return False
+    if written_attr is None:
+        return True  # Creating or deleting a domain term affects all of its attributes
+    return used_attr is not None and (written_attr == used_attr or ANY in (written_attr, used_attr))
+
+
+class Footprint:
+    """
+    The model items that a scenario reads and writes, including the items that the constraints of
+    its modifiers read. Step arguments are filled in, except for those that have a modifier. Two
+    scenarios that do not write what the other one uses, commute: inserting them in either order
+    leads to the same model state. Scenarios that can be split for refinement never commute,
+    because their refinement is part of their effect.
+    """
+
+    def __init__(self, scenario: Scenario):
+        self.reads: set[Item] = set()
+        self.writes: set[Item] = set()
+        self.refinable: bool = False
+        plan = get_modifier_plan(scenario)
+        modified = {(mod.step_index, scenario.steps[mod.step_index].args[mod.arg_index].arg) for mod in plan}
+        for step_index, step in enumerate(scenario.steps):
+            fixed_args = StepArguments([arg for arg in step.args if (step_index, arg.arg) not in modified])
+            for constraint in [mod.constraint for mod in plan if mod.step_index == step_index
+                               and mod.constraint and mod.constraint != '.*']:
+                # The options of a modifier depend on the model items that its constraint reads
+                info = ExpressionInfo(fixed_args.fill_in_args(constraint, as_code=True))
+                self.reads |= info.reads
+                self.writes |= info.writes
+            for expr in _relevant_expressions(step):
+                info = ExpressionInfo(fixed_args.fill_in_args(expr.strip(), as_code=True))
+                self.reads |= info.reads
+                self.writes |= info.writes
+                if step.gherkin_kw in ('when', None) and expr in step.model_info['OUT'] and info.is_condition:
+                    self.refinable = True
+
+    def commutes_with(self, other: 'Footprint') -> bool:
+        if self.refinable or other.refinable:
+            return False
+        return not (any(_affects(w, u) for w in self.writes for u in other.reads | other.writes)
+                    or any(_affects(w, u) for w in other.writes for u in self.reads | self.writes))
+
+
+class DependencyAnalysis:
+    """
+    Static analysis of the :IN: and :OUT: expressions of all scenarios. It finds out which domain
+    terms (`new X`) and attributes (`X.attr = ...`) each scenario needs and provides, and from
+    that, which scenarios depend on which other scenarios.
+
+    The analysis is an over-approximation: anything that a scenario provides is considered to be
+    available from then on, regardless of order, deletions or values, and anything that depends
+    on step arguments is considered to be always available. A scenario that is reported as
+    unreachable can therefore never be part of a trace. A scenario's depth is the number of
+    rounds of other scenarios that must at least precede it. Depth 0 fits in an empty model.
+
+    Scenarios that refer to none of the same names, can never influence each other. These form
+    separate clusters. Names include aliases, the scenario scope, which links a scenario to its
+    refinements, and the names that modifiers use to get their options. Step arguments are assumed
+    to be values, unless they are used as a domain term. A domain term that depends on a step
+    argument could be any term, which keeps all scenarios in a single cluster.
+
+    Scenarios whose steps evaluate exactly the same expressions are equivalent. If one of them does
+    not fit the model, none of them do. Scenarios with step modifiers are never equivalent, because
+    their expressions depend on the chosen data variant.
+    """
+
+    def __init__(self, scenarios: list[Scenario]):
+        self.depth: dict[int, int] = {}
+        self.unreachable: dict[int, str] = {}
+        self.depends_on: dict[int, set[int]] = {s.src_id: set() for s in scenarios}
+        self.clusters: list[list[int]] = [[s.src_id for s in scenarios]]
+        self.equivalents: dict[int, list[int]] = {}  # The other members of each scenario's equivalence class
+        self._find_equivalents(scenarios)
+        self.footprints: dict[int, Footprint | None] = {s.src_id: self._footprint(s) for s in scenarios}
+        self._commuting: dict[tuple[int, int], bool] = {}
+        self._exit_reads: dict[tuple[str, ...], frozenset[Item] | None] = {}
+        self._refiners: dict[frozenset[Item], frozenset[int]] = {}
+        try:
+            expressions = {s.src_id: list(self._expressions(s)) for s in scenarios}
+        except Exception:
+            # Incomplete model info is reported during the search, where it can be pointed out in context
+            self.depth = {s.src_id: 0 for s in scenarios}
+            return
+        self._find_depths(expressions)
+        self._find_dependencies(expressions)
+        self._find_clusters({s.src_id: set().union(*[info.names for _, info in expressions[s.src_id]],
+                                                   self._modifier_names(s)) for s in scenarios})
+        for scenario in scenarios:
+            if scenario.src_id not in self.depth:
+                step, info, item = self._first_blocker(expressions[scenario.src_id], self._available)
+                self.unreachable[scenario.src_id] = (f"{scenario.name}: no scenario provides {self._describe(item)}"
+                                                     f", needed in step '{step}' [{info.expression}]")
+
+    @staticmethod
+    def _expressions(scenario: Scenario) -> Iterator[tuple[Step, ExpressionInfo]]:
+        for step in scenario.steps:
+            for expr in _relevant_expressions(step):
+                yield step, ExpressionInfo(expr)
+
+    @staticmethod
+    def _modifier_names(scenario: Scenario) -> set[str]:
+        """The names that the constraints of the scenario's modifiers refer to, to get their options"""
+        try:
+            return set().union(*[ExpressionInfo(mod.constraint).names for mod in get_modifier_plan(scenario)
+                                 if mod.constraint and mod.constraint != '.*'])
+        except Exception:
+            return {ANY}  # Errors in modifiers are reported during the search
+
+    @staticmethod
+    def _describe(item: Item) -> str:
+        return item[0] if item[1] is None else f"{item[0]}.{item[1]}"
+
+    @staticmethod
+    def _is_available(item: Item, available: set[Item]) -> bool:
+        term, attr = item
+        if attr is None:
+            return (term, None) in available or (ANY, None) in available
+        return bool({(term, attr), (term, ANY), (ANY, attr), (ANY, ANY)} & available)
+
+    def _first_blocker(self, expressions, available: set[Item]):
+        """Returns the first step, expression and item that is needed, but not available"""
+        own = set(available)
+        for step, info in expressions:
+            for item in info.needs:
+                if not self._is_available(item, own):
+                    return step, info, item
+            own.update(info.provides)
+        return None
+
+    def _find_depths(self, expressions: dict[int, list[tuple[Step, ExpressionInfo]]]):
+        """
+        Determines, round by round, which part of each scenario can be inserted with the items
+        provided so far. Partially inserted scenarios provide the items of their inserted steps,
+        which is what makes refinement possible. A scenario's depth is the round in which it fits
+        in full for the first time.
+        """
+        available: set[Item] = set()
+        depth = 0
+        while True:
+            provided = set(available)
+            for index, scenario_expressions in expressions.items():
+                own = set(available)
+                for step, info in scenario_expressions:
+                    if not all(self._is_available(item, own) for item in info.needs):
+                        break
+                    own.update(info.provides)
+                    provided.update(info.provides)
+                else:
+                    self.depth.setdefault(index, depth)
+            if provided == available:
+                break
+            available = provided
+            depth += 1
+        self._available = available
+
+    @staticmethod
+    def _footprint(scenario: Scenario) -> Footprint | None:
+        try:
+            return Footprint(scenario)
+        except Exception:
+            return None  # Errors in the model info are reported during the search
+
+    def commute(self, first: int, second: int) -> bool:
+        """Whether inserting the two scenarios in either order leads to the same model state"""
+        key = (min(first, second), max(first, second))
+        if key not in self._commuting:
+            footprints = self.footprints.get(first), self.footprints.get(second)
+            self._commuting[key] = None not in footprints and footprints[0].commutes_with(footprints[1])
+        return self._commuting[key]
+
+    def refiners(self, refined_step: Step) -> frozenset[int] | None:
+        """
+        Returns the scenarios that can help to meet the exit conditions of a refinement, which are the
+        :OUT: expressions of the refined step. These are the scenarios that write model items that the
+        conditions read, and the scenarios that can be refined themselves. Returns None when any
+        scenario could help, for instance when a condition uses the scenario scope.
+        """
+        reads = self._exit_condition_reads(refined_step)
+        if reads is None:
+            return None
+        if reads not in self._refiners:
+            self._refiners[reads] = frozenset(index for index, footprint in self.footprints.items()
+                                              if footprint is None or footprint.refinable
+                                              or any(_affects(w, r) for w in footprint.writes for r in reads))
+        return self._refiners[reads]
+
+    def exit_unchanged(self, tracestate: TraceState) -> bool:
+        """
+        Whether the exit conditions of the innermost open refinement certainly still fail. They failed
+        when the refinement started, and still do if none of the scenarios inserted since, wrote any
+        model item that the conditions read. Only used for conditions without side effects.
+        """
+        index = tracestate.active_refinements[-1]
+        reads = self._exit_condition_reads(tracestate.get_remainder(index).steps[1])
+        if reads is None:
+            return False
+        start = len(tracestate) - tracestate.id_trace[::-1].index(f"{index}.{tracestate.highest_part(index)}")
+        dirty: set[Item] = set()
+        for snapshot in tracestate[start:]:
+            footprint = self.footprints.get(int(snapshot.id.split('.')[0]))
+            if footprint is None:
+                return False
+            dirty |= footprint.writes
+        return not any(_affects(w, r) for w in dirty for r in reads)
+
+    def _exit_condition_reads(self, refined_step: Step) -> frozenset[Item] | None:
+        """
+        Returns the model items that the exit conditions of a refined step read, or None if these
+        are not known. For instance when the conditions use the scenario scope, or have side effects.
+        """
+        key = tuple(refined_step.args.fill_in_args(expr.strip(), as_code=True)
+                    for expr in refined_step.model_info['OUT'])
+        if key not in self._exit_reads:
+            infos = [ExpressionInfo(expr) for expr in key]
+            if not infos or any('scenario' in info.names or not info.reads or info.writes for info in infos):
+                self._exit_reads[key] = None
+            else:
+                self._exit_reads[key] = frozenset().union(*[info.reads for info in infos])
+        return self._exit_reads[key]
+
+    def _find_equivalents(self, scenarios: list[Scenario]):
+        classes: dict[tuple, list[int]] = {}
+        for scenario in scenarios:
+            key = self._behaviour(scenario)
+            if key is not None:
+                classes.setdefault(key, []).append(scenario.src_id)
+        for members in classes.values():
+            if len(members) > 1:
+                for index in members:
+                    self.equivalents[index] = [other for other in members if other != index]
+
+    @staticmethod
+    def _behaviour(scenario: Scenario) -> tuple | None:
+        """
+        Returns the expressions that the scenario evaluates, step by step, with the step arguments
+        filled in. Arguments that appear in an expression are included by value, because they can
+        become aliases. Returns None if the scenario's behaviour also depends on other factors.
+        """
+        behaviour = []
+        for step in scenario.steps:
+            if 'error' in step.model_info or step.model_info.get('MOD'):
+                return None
+            try:
+                expressions = tuple(step.args.fill_in_args(expr.strip(), as_code=True)
+                                    for expr in _relevant_expressions(step))
+            except Exception:
+                return None
+            args = tuple(sorted((arg.codestring, repr(arg.value)) for arg in step.args
+                                if arg.codestring and any(arg.codestring in expr for expr in expressions)))
+            behaviour.append((step.gherkin_kw, expressions, args))
+        return tuple(behaviour)
+
+    def _find_clusters(self, scenario_names: dict[int, set[str]]):
+        clusters: list[tuple[set[str], list[int]]] = []
+        for index, names in scenario_names.items():
+            if ANY in names:
+                return
+            joined = [cluster for cluster in clusters if cluster[0] & names]
+            clusters = [cluster for cluster in clusters if not cluster[0] & names]
+            clusters.append((names.union(*[names for names, _ in joined]),
+                             [member for _, members in joined for member in members] + [index]))
+        order = list(scenario_names)
+        self.clusters = sorted([sorted(members, key=order.index) for _, members in clusters],
+                               key=lambda members: order.index(members[0]))
+
+    def _find_dependencies(self, expressions: dict[int, list[tuple[Step, ExpressionInfo]]]):
+        providers: dict[Item, set[int]] = {}
+        for index, scenario_expressions in expressions.items():
+            for _, info in scenario_expressions:
+                for item in info.provides:
+                    providers.setdefault(item, set()).add(index)
+        for index, scenario_expressions in expressions.items():
+            own: set[Item] = set()
+            for _, info in scenario_expressions:
+                for item in info.needs:
+                    if not self._is_available(item, own):
+                        self.depends_on[index] |= {provider for provided, ids in providers.items()
+                                                   if self._is_available(item, {provided})
+                                                   for provider in ids if provider != index}
+                own.update(info.provides)
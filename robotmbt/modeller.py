@@ -30,22 +30,28 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from typing import Any
+from typing import Any, Callable, NamedTuple
 
 from robot.api import logger
 from robot.utils import is_list_like
 
-from .modelspace import ModelSpace
+from .datacoverage import DataCoverage
+from .modelspace import ModelSpace, OptionCache
 from .steparguments import StepArguments, ArgKind
 from .substitutionmap import SubstitutionMap
 from .suitedata import Scenario, Step
 from .tracestate import TraceState, TraceSnapShot
 
+# Constraints are often evaluated many times against the same model state while backtracking
+option_cache = OptionCache()
 
-def try_to_fit_in_scenario(candidate: Scenario, tracestate: TraceState):
+
+def try_to_fit_in_scenario(candidate: Scenario, tracestate: TraceState,
+                           exit_unchanged: Callable[[TraceState], bool] | None = None):
     """
     Tries to insert the candidate scenario into the trace (in full or partial) and
-    updates tracestate accordingly.
+    updates tracestate accordingly. The optional exit_unchanged check tells whether the
+    exit conditions of the open refinement can be skipped, because they certainly still fail.
     """
     model = tracestate.model if tracestate.model else ModelSpace()
     model.new_scenario_scope()
@@ -58,7 +64,11 @@ def try_to_fit_in_scenario(candidate: Scenario, tracestate: TraceState):
         tracestate.confirm_full_scenario(inserted.src_id, inserted, model)
         logger.debug(f"Inserted scenario {inserted.src_id}, {inserted.name}")
         if tracestate.is_refinement_active():
-            handle_refinement_exit(inserted, tracestate)
+            handle_refinement_exit(inserted, tracestate, exit_unchanged)
+    elif not tracestate.refinement_allowed(inserted.src_id, model, remainder):
+        tracestate.reject_scenario(candidate.src_id)
+        logger.debug(f"Unable to insert scenario {candidate.src_id}, {candidate.name}, because refining step "
+                     f"'{remainder.steps[1]}' exceeds the refinement depth or repeats an earlier refinement")
     else:  # the scenario is split into two parts, ready for refinement
         logger.debug(f"Partially inserted scenario {inserted.src_id}, {inserted.name}\n"
                      f"Refinement needed at step: {remainder.steps[1]}")
@@ -121,103 +131,167 @@ def _escape_robot_vars(text: str) -> str:
     return text
 
 
-def handle_refinement_exit(inserted_refinement: Scenario, tracestate: TraceState):
-    refinement_tail = tracestate.get_remainder(tracestate.active_refinements[-1])
-    exit_conditions = refinement_tail.steps[1].model_info['OUT']
-    exit_conditions_processed = False
-    for expr in exit_conditions:
-        try:
-            if tracestate.model.process_expression(expr, refinement_tail.steps[1].args) is False:
-                break
-        except Exception:
-            break
-    else:
-        exit_conditions_processed = True
-
-    if not exit_conditions_processed:
-        rewind(tracestate)  # Reject insterted scenario. Even though it fits, it is not a refinement.
-        logger.debug(f"Reconsidering scenario {inserted_refinement.src_id}, {inserted_refinement.name}, "
-                     f"did not meet refinement exit condition: {exit_conditions}")
-        return
-
-    model = tracestate.model
-    tail_inserted, remainder, extra_data = process_scenario(refinement_tail, model)
-    if not tail_inserted:
-        logger.debug(extra_data['fail_msg'])
-        # Confirm then rewind, to roll back complete scenario, including its refiements
-        # Because that exit check passed, this is an error in the refined scenario itself
-        tracestate.confirm_full_scenario(refinement_tail.src_id, refinement_tail, model)
-        tail = rewind(tracestate)
-        logger.debug(f"Having to roll back up to {tail.scenario.name if tail else 'the beginning'}")
-    elif not remainder:
+def handle_refinement_exit(inserted_refinement: Scenario, tracestate: TraceState,
+                           exit_unchanged: Callable[[TraceState], bool] | None = None):
+    """
+    Completes open refinements after inserting a scenario. Each completed scenario can in turn be the
+    refinement of the next open refinement, so this continues until the exit conditions are not met,
+    a remainder needs refinement itself, or no refinement is active anymore.
+    """
+    while tracestate.is_refinement_active():
+        refinement_tail = tracestate.get_remainder(tracestate.active_refinements[-1])
+        exit_conditions = refinement_tail.steps[1].model_info['OUT']
+        if ((exit_unchanged and exit_unchanged(tracestate))
+                or not exit_conditions_met(refinement_tail, tracestate.model)):
+            rewind(tracestate)  # Reject insterted scenario. Even though it fits, it is not a refinement.
+            logger.debug(f"Reconsidering scenario {inserted_refinement.src_id}, {inserted_refinement.name}, "
+                         f"did not meet refinement exit condition: {exit_conditions}")
+            return
+
+        model = tracestate.model
+        tail_inserted, remainder, extra_data = process_scenario(refinement_tail, model)
+        if tail_inserted and remainder and not tracestate.refinement_allowed(tail_inserted.src_id, model, remainder):
+            tail_inserted = None
+            extra_data = dict(fail_msg=f"Refinement of scenario {refinement_tail.src_id}, {refinement_tail.name}, "
+                                       f"at step '{remainder.steps[1]}' exceeds the refinement depth or repeats "
+                                       f"an earlier refinement")
+        if not tail_inserted:
+            logger.debug(extra_data['fail_msg'])
+            # Confirm then rewind, to roll back complete scenario, including its refiements
+            # Because that exit check passed, this is an error in the refined scenario itself
+            tracestate.confirm_full_scenario(refinement_tail.src_id, refinement_tail, model)
+            tail = rewind(tracestate)
+            logger.debug(f"Having to roll back up to {tail.scenario.name if tail else 'the beginning'}")
+            return
+        if remainder:
+            logger.debug(f"Partially inserted remainder of scenario {tail_inserted.src_id}, {tail_inserted.name}\n"
+                         f"refinement needed at step: {remainder.steps[1]}")
+            tail_inserted.name = f"{tail_inserted.name} (part {tracestate.highest_part(tail_inserted.src_id)+1})"
+            tracestate.push_partial_scenario(tail_inserted.src_id, tail_inserted, model, remainder)
+            return
+
         model.end_scenario_scope()
         tracestate.confirm_full_scenario(tail_inserted.src_id, tail_inserted, model)
         logger.debug(f"Scenario '{tail_inserted.name}' completed after refinement")
-        if tracestate.is_refinement_active():
-            handle_refinement_exit(tail_inserted, tracestate)
-    else:
-        logger.debug(f"Partially inserted remainder of scenario {tail_inserted.src_id}, {tail_inserted.name}\n"
-                     f"refinement needed at step: {remainder.steps[1]}")
-        tail_inserted.name = f"{tail_inserted.name} (part {tracestate.highest_part(tail_inserted.src_id)+1})"
-        tracestate.push_partial_scenario(tail_inserted.src_id, tail_inserted, model, remainder)
+        inserted_refinement = tail_inserted
 
 
-def generate_scenario_variant(scenario: Scenario, model: ModelSpace) -> Scenario | None:
-    scenario = scenario.copy()
-    # collect set of constraints
-    subs = SubstitutionMap()
-    try:
-        for step in scenario.steps:
+def exit_conditions_met(refinement_tail: Scenario, model: ModelSpace) -> bool:
+    """
+    Checks whether the model meets the exit conditions of the refined step, that is the first
+    step of the refinement tail. The model is updated as if the conditions were processed.
+    """
+    for expr in refinement_tail.steps[1].model_info['OUT']:
+        try:
+            if model.process_expression(expr, refinement_tail.steps[1].args) is False:
+                return False
+        except Exception:
+            return False
+    return True
+
+
+class Modifier(NamedTuple):
+    """A single :MOD: expression, resolved to the step argument it modifies"""
+
+    expression: str
+    step_index: int
+    arg_index: int
+    kind: ArgKind
+    constraint: str
+    example_value: Any
+    in_then_step: bool
+
+
+def get_modifier_plan(scenario: Scenario) -> list[Modifier]:
+    """
+    Returns the modifiers of the scenario in order of appearance. Parsing the :MOD: expressions
+    and locating their arguments is done once per scenario, the plan is kept with the scenario.
+    Arguments that take their keyword's default value are never modified and are left out.
+    """
+    if scenario.modifier_plan is None:
+        plan = []
+        for step_index, step in enumerate(scenario.steps):
             for expr in step.model_info.get('MOD', []):
                 modded_arg, constraint = _parse_modifier_expression(expr, step.args)
-                if step.args[modded_arg].is_default:
+                arg_index = next(i for i, arg in enumerate(step.args) if arg.arg == modded_arg)
+                arg = step.args[arg_index]
+                if arg.is_default:
                     continue
-                if step.args[modded_arg].kind in [ArgKind.EMBEDDED, ArgKind.POSITIONAL, ArgKind.NAMED]:
-                    org_example = step.args[modded_arg].org_value
-                    if step.gherkin_kw == 'then':
-                        constraint = None  # No new constraints are processed for then-steps
-                        if org_example not in subs.substitutions:
-                            # if a then-step signals the first use of an example value, it is considered a new definition
-                            subs.substitute(org_example, [org_example])
-                            continue
-                    if not constraint and org_example not in subs.substitutions:
-                        raise ValueError(f"No options to choose from at first assignment to {org_example}")
-                    if constraint and constraint != '.*':
-                        options = model.process_expression(constraint, step.args)
-                        if options == 'exec':
-                            raise ValueError(f"Invalid constraint for argument substitution: {expr}")
-                        if not options:
-                            raise ValueError(f"Constraint on modifer did not yield any options: {expr}")
-                        if not is_list_like(options):
-                            raise ValueError(f"Constraint on modifer did not yield a set of options: {expr}")
-                    else:
-                        options = None
-                    subs.substitute(org_example, options)
-                elif step.args[modded_arg].kind == ArgKind.VAR_POS:
-                    if step.args[modded_arg].value:
-                        modded_varargs = model.process_expression(constraint, step.args)
-                        if not is_list_like(modded_varargs):
-                            raise ValueError(f"Modifying varargs must yield a list of arguments")
-                        # Varargs are not added to the substitution map, but are used directly as-is. A modifier can
-                        # change the number of arguments in the list, making it impossible to decide which values to
-                        # match and which to drop and/or duplicate.
-                        step.args[modded_arg].value = modded_varargs
-                elif step.args[modded_arg].kind == ArgKind.FREE_NAMED:
-                    if step.args[modded_arg].value:
-                        modded_free_args = model.process_expression(constraint, step.args)
-                        if not isinstance(modded_free_args, dict):
-                            raise ValueError("Modifying free named arguments must yield a dict")
-                        # Similar to varargs, modified free named arguments are used directly as-is.
-                        step.args[modded_arg].value = modded_free_args
-                else:
+                if arg.kind not in [ArgKind.EMBEDDED, ArgKind.POSITIONAL, ArgKind.NAMED,
+                                    ArgKind.VAR_POS, ArgKind.FREE_NAMED]:
                     raise AssertionError(f"Unknown argument kind for {modded_arg}")
+                plan.append(Modifier(expr, step_index, arg_index, arg.kind, constraint, arg.org_value,
+                                     step.gherkin_kw == 'then'))
+        scenario.modifier_plan = plan
+    return scenario.modifier_plan
+
+
+def generate_scenario_variant(scenario: Scenario, model: ModelSpace,
+                              data_coverage: DataCoverage | None = None) -> Scenario | None:
+    step = None
+    try:
+        plan = get_modifier_plan(scenario)
+    except Exception as err:
+        logger.debug(f"Unable to insert scenario {scenario.src_id}, {scenario.name}, due to modifier\n"
+                     f"    {err}")
+        return None
+    # Only the steps with modifiers are copied, the others stay shared with the original scenario
+    scenario = scenario.derive()
+    for step_index in {mod.step_index for mod in plan}:
+        scenario.own_step(step_index)
+    # collect set of constraints
+    subs = SubstitutionMap()
+    try:
+        for mod in plan:
+            step = scenario.steps[mod.step_index]
+            if mod.kind in [ArgKind.EMBEDDED, ArgKind.POSITIONAL, ArgKind.NAMED]:
+                org_example = mod.example_value
+                constraint = mod.constraint
+                if mod.in_then_step:
+                    constraint = None  # No new constraints are processed for then-steps
+                    if org_example not in subs.substitutions:
+                        # if a then-step signals the first use of an example value, it is considered a new definition
+                        subs.substitute(org_example, [org_example])
+                        continue
+                if not constraint and org_example not in subs.substitutions:
+                    raise ValueError(f"No options to choose from at first assignment to {org_example}")
+                if constraint and constraint != '.*':
+                    options = option_cache.evaluate(model, constraint, step.args)
+                    if options == 'exec':
+                        raise ValueError(f"Invalid constraint for argument substitution: {mod.expression}")
+                    if not options:
+                        raise ValueError(f"Constraint on modifer did not yield any options: {mod.expression}")
+                    if not is_list_like(options):
+                        raise ValueError(f"Constraint on modifer did not yield a set of options: {mod.expression}")
+                else:
+                    options = None
+                subs.substitute(org_example, options)
+            elif mod.kind == ArgKind.VAR_POS:
+                if step.args[mod.arg_index].value:
+                    modded_varargs = model.process_expression(mod.constraint, step.args)
+                    if not is_list_like(modded_varargs):
+                        raise ValueError(f"Modifying varargs must yield a list of arguments")
+                    # Varargs are not added to the substitution map, but are used directly as-is. A modifier can
+                    # change the number of arguments in the list, making it impossible to decide which values to
+                    # match and which to drop and/or duplicate.
+                    step.args[mod.arg_index].value = modded_varargs
+            elif mod.kind == ArgKind.FREE_NAMED:
+                if step.args[mod.arg_index].value:
+                    modded_free_args = model.process_expression(mod.constraint, step.args)
+                    if not isinstance(modded_free_args, dict):
+                        raise ValueError("Modifying free named arguments must yield a dict")
+                    # Similar to varargs, modified free named arguments are used directly as-is.
+                    step.args[mod.arg_index].value = modded_free_args
     except Exception as err:
         logger.debug(f"Unable to insert scenario {scenario.src_id}, {scenario.name}, due to modifier\n"
                      f"    In step {step}: {err}")
         return None
 
     try:
-        subs.solve()
+        if data_coverage:
+            data_coverage.select_solution(scenario.src_id, subs)
+        else:
+            subs.solve()
     except ValueError as err:
         logger.debug(f"Unable to insert scenario {scenario.src_id}, {scenario.name}, due to modifier\n"
                      f"    {err}: {subs}")
@@ -227,15 +301,9 @@ def generate_scenario_variant(scenario: Scenario, model: ModelSpace) -> Scenario
     if subs.solution:
         logger.debug(f"Example variant generated with argument substitution: {subs}")
     scenario.data_choices = subs
-    for step in scenario.steps:
-        if 'MOD' in step.model_info:
-            for expr in step.model_info['MOD']:
-                modded_arg, _ = _parse_modifier_expression(expr, step.args)
-                if step.args[modded_arg].is_default:
-                    continue
-                org_example = step.args[modded_arg].org_value
-                if step.args[modded_arg].kind in [ArgKind.EMBEDDED, ArgKind.POSITIONAL, ArgKind.NAMED]:
-                    step.args[modded_arg].value = subs.solution[org_example]
+    for mod in plan:
+        if mod.kind in [ArgKind.EMBEDDED, ArgKind.POSITIONAL, ArgKind.NAMED]:
+            scenario.steps[mod.step_index].args[mod.arg_index].value = subs.solution[mod.example_value]
     return scenario
 
 
@@ -256,6 +324,6 @@ def rewind(tracestate: TraceState, drought_recovery: bool = False) -> TraceSnapS
         # When rewinding an 'in between' part, rewind both the part and the refinement
         tracestate.rewind()
     tail = tracestate.rewind()
-    while drought_recovery and tracestate.coverage_drought:
+    while drought_recovery and tracestate.coverage_drought and tracestate.can_rewind():
         tail = tracestate.rewind()
     return tail
@@ -30,7 +30,11 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import ast
+import builtins
 import copy
+import functools
+from collections import OrderedDict
 from typing import Any
 
 from .steparguments import StepArguments
@@ -40,6 +44,24 @@ class ModellingError(Exception):
     pass
 
 
+@functools.lru_cache(maxsize=1024)
+def _compile_expression(expression: str):
+    """Expressions are evaluated many times while searching for a trace, but compiled only once"""
+    return compile(expression, '<string>', 'eval')
+
+
+@functools.lru_cache(maxsize=1024)
+def _free_names(expression: str) -> frozenset[str] | None:
+    """Names that the expression reads, excluding names it binds itself, like comprehension variables"""
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError:
+        return None
+    loaded = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+    stored = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)}
+    return frozenset(loaded - stored)
+
+
 class ModelSpace:
     def __init__(self, reference_id=None):
         self.ref_id: str = str(reference_id)
@@ -80,6 +102,18 @@ class ModelSpace:
         else:
             return self.__dict__.keys()
 
+    def merge(self, other: 'ModelSpace'):
+        """Adds the domain terms and aliases of another model, that uses different domain terms"""
+        for name, prop in other.props.items():
+            if name == 'scenario':
+                continue  # Scenario scopes are not merged, the scope of this model remains
+            if name in self.props or name in self.values:
+                raise ModellingError(f"Naming conflict, '{name}' already in use.")
+            self.props[name] = copy.deepcopy(prop)
+            setattr(self, name, self.props[name])
+        for name, value in other.values.items():
+            self.values.setdefault(name, value)
+
     def new_scenario_scope(self):
         self.scenario_vars.append(RecursiveScope(self.scenario_vars[-1] if len(self.scenario_vars) else None))
         self.props['scenario'] = self.scenario_vars[-1]
@@ -109,7 +143,7 @@ class ModelSpace:
             value = f"'{self.values[v]}'" if isinstance(self.values[v], str) else self.values[v]
             exec(f"{v} = {value}", local_locals)
         try:
-            result = eval(expr, local_locals)
+            result = eval(_compile_expression(expr), local_locals)
         except SyntaxError:
             try:
                 exec(expr, local_locals)
@@ -229,3 +263,67 @@ class RecursiveScope:
             res += f"{k}={v}, "
         res += "}"
         return res
+
+
+class OptionCache:
+    """
+    Bounded cache for the options that modifier constraints yield. Entries are keyed by the
+    expression and the values of the model attributes it refers to, so that an entry is no
+    longer found as soon as any of those attributes change. Expressions that refer to the
+    scenario scope, to unknown names or to nested domain objects are always evaluated.
+    """
+    SIMPLE_TYPES = (str, int, float, bool, type(None))
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize: int = maxsize
+        self._entries: OrderedDict[tuple, Any] = OrderedDict()
+
+    def evaluate(self, model: ModelSpace, expression: str, step_args: StepArguments = StepArguments()) -> Any:
+        key = self._key(model, step_args.fill_in_args(expression.strip(), as_code=True))
+        if key is not None and key in self._entries:
+            self._entries.move_to_end(key)
+            return copy.copy(self._entries[key])
+        result = model.process_expression(expression, step_args)
+        if key is not None and self._is_cacheable(result):
+            self._entries[key] = result
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            result = copy.copy(result)
+        return result
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, model: ModelSpace, expr: str) -> tuple | None:
+        names = _free_names(expr)
+        if names is None:
+            return None
+        state = []
+        for name in sorted(names):
+            if name in model.props:
+                if name == 'scenario':
+                    return None
+                prop_state = tuple((attr, getattr(model.props[name], attr)) for attr in dir(model.props[name]))
+                if not all(self._is_simple(value) for _, value in prop_state):
+                    return None
+                state.append((name, repr(prop_state)))
+            elif name in model.values:
+                state.append((name, repr(model.values[name])))
+            elif not hasattr(builtins, name):
+                return None  # Evaluation would add an alias to the model
+        return expr, tuple(state)
+
+    @classmethod
+    def _is_simple(cls, value: Any) -> bool:
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return all(isinstance(item, cls.SIMPLE_TYPES) for item in value)
+        if isinstance(value, dict):
+            return all(isinstance(item, cls.SIMPLE_TYPES) for item in (*value.keys(), *value.values()))
+        return isinstance(value, cls.SIMPLE_TYPES + (range,))
+
+    @classmethod
+    def _is_cacheable(cls, result: Any) -> bool:
+        return result != 'exec' and isinstance(result, (list, tuple, set, frozenset, range)) and cls._is_simple(result)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2026, J. Foederer
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from collections import deque
+
+from robot.api import logger
+
+from . import modeller
+from .modelspace import ModelSpace
+from .suitedata import Scenario
+from .tracestate import TraceState
+
+
+class Insertion:
+    """A scenario, or a part of a scenario, as it is inserted into the trace"""
+
+    def __init__(self, index: int, scenario: Scenario, model: ModelSpace, remainder: Scenario | None = None):
+        self.index: int = index
+        self.scenario: Scenario = scenario
+        self.model: ModelSpace = model
+        self.remainder: Scenario | None = remainder  # Only set for partial scenarios that need refinement
+
+
+class Transition:
+    """
+    Moves the model from one state to another by inserting a single scenario, including any
+    scenarios that refine it. Insertions lists the scenarios and parts in trace order.
+    """
+
+    def __init__(self, source: str, target: str, insertions: list[Insertion]):
+        self.source: str = source
+        self.target: str = target
+        self.insertions: list[Insertion] = insertions
+        self.index: int = insertions[0].index
+        self.covers: frozenset[int] = _covers(insertions)
+
+
+def _covers(insertions: list[Insertion]) -> frozenset[int]:
+    return frozenset(ins.index for ins in insertions if ins.remainder is None)
+
+
+class StateGraph:
+    """
+    All model states that are reachable from the empty model, found by a breadth-first exploration.
+    States are identified by their fingerprint, the model's status text, which makes states that
+    only differ in their history the same state. The transitions between states are the scenarios.
+
+    Exploration stops at max_depth scenarios from the initial state, and when max_states states are
+    found. If neither limit is reached, the graph is complete. Each scenario is tried with a single
+    data variant per state. Only a complete graph of a model without step modifiers is exact, and
+    proves that scenarios that are not covered can never be reached. Refinements that would nest
+    deeper than max_refinement_depth (0 for unlimited) are not explored, which makes the graph incomplete.
+    """
+
+    def __init__(self, scenarios: list[Scenario], max_depth: int, max_states: int, max_refinement_depth: int = 0):
+        self.scenarios: list[Scenario] = scenarios
+        self.max_depth: int = max_depth
+        self.max_states: int = max_states
+        self.max_refinement_depth: int = max_refinement_depth
+        self.initial: str = ModelSpace().get_status_text()
+        self.states: dict[str, ModelSpace] = {self.initial: ModelSpace()}
+        self.depth: dict[str, int] = {self.initial: 0}
+        self.transitions: dict[str, list[Transition]] = {}
+        self.complete: bool = True
+        self._explore()
+
+    @property
+    def exact(self) -> bool:
+        return self.complete and not any(modeller.get_modifier_plan(s) for s in self.scenarios)
+
+    @property
+    def covered(self) -> set[int]:
+        return {index for edges in self.transitions.values() for edge in edges for index in edge.covers}
+
+    @property
+    def n_transitions(self) -> int:
+        return sum(len(edges) for edges in self.transitions.values())
+
+    def _explore(self):
+        queue = deque([self.initial])
+        while queue:
+            source = queue.popleft()
+            if self.depth[source] >= self.max_depth:
+                self.complete = False
+                continue
+            self.transitions[source] = []
+            for scenario in self.scenarios:
+                for target, paths in self._completions(scenario, self.states[source], ()).items():
+                    if target not in self.states:
+                        if len(self.states) >= self.max_states:
+                            self.complete = False
+                            continue
+                        self.states[target] = paths[0][-1].model
+                        self.depth[target] = self.depth[source] + 1
+                        queue.append(target)
+                    self.transitions[source] += [Transition(source, target, path) for path in paths]
+
+    def _completions(self, scenario: Scenario, model: ModelSpace,
+                     refining: tuple[int, ...]) -> dict[str, list[list[Insertion]]]:
+        """
+        Returns the ways to insert the scenario in full into a trace that ends in the given model,
+        by the fingerprint of the model that results. Refining lists the scenarios with an open
+        refinement, that are not available as a refinement themselves.
+        """
+        variant = modeller.generate_scenario_variant(scenario, model)
+        if not variant:
+            return {}
+        model = model.copy()
+        model.new_scenario_scope()
+        inserted, remainder, _ = modeller.process_scenario(variant, model)
+        if not inserted:
+            return {}
+        if not remainder:
+            model.end_scenario_scope()
+            return {model.get_status_text(): [[Insertion(inserted.src_id, inserted, model)]]}
+        if self.max_refinement_depth and len(refining) >= self.max_refinement_depth:
+            self.complete = False
+            return {}
+        return self._refinements([Insertion(inserted.src_id, inserted, model, remainder)],
+                                 refining + (inserted.src_id,))
+
+    def _refinements(self, insertions: list[Insertion],
+                     refining: tuple[int, ...]) -> dict[str, list[list[Insertion]]]:
+        """
+        Completes the partial scenario at the end of insertions with every scenario that refines it.
+        Different refinements often lead to the same model state. These are all kept as long as
+        they cover different scenarios, because some scenarios can only occur as a refinement.
+        """
+        results = {}
+        part = insertions[-1]
+        for scenario in self.scenarios:
+            if scenario.src_id in refining:
+                continue
+            for inner in [path for paths in self._completions(scenario, part.model, refining).values()
+                          for path in paths]:
+                model = inner[-1].model
+                if not modeller.exit_conditions_met(part.remainder, model.copy()):
+                    continue
+                model = model.copy()
+                tail, remainder, _ = modeller.process_scenario(part.remainder, model)
+                if not tail:
+                    continue
+                if not remainder:
+                    model.end_scenario_scope()
+                    self._keep(results, insertions + inner + [Insertion(tail.src_id, tail, model)])
+                else:
+                    completed = self._refinements(insertions + inner
+                                                  + [Insertion(tail.src_id, tail, model, remainder)], refining)
+                    for path in [path for paths in completed.values() for path in paths]:
+                        self._keep(results, path)
+        return results
+
+    @staticmethod
+    def _keep(results: dict[str, list[list[Insertion]]], path: list[Insertion]):
+        """Adds the path, unless the paths to the same model state already cover all of its scenarios"""
+        target = path[-1].model.get_status_text()
+        covered = {index for kept in results.get(target, []) for index in _covers(kept)}
+        if not _covers(path) <= covered:
+            results.setdefault(target, []).append(path)
+
+    def walk(self, uncovered: set[int]) -> list[Transition] | None:
+        """
+        Returns a path through the graph, starting from the initial state, that covers all scenarios
+        in uncovered. Each time, the path is extended with the shortest route to a transition that
+        covers a scenario that is not covered yet. If a state has multiple of those transitions, the
+        one covering the most scenarios is taken. Returns None if not all scenarios can be covered.
+        """
+        uncovered = set(uncovered)
+        path = []
+        state = self.initial
+        while uncovered:
+            route = self._route_to_coverage(state, uncovered)
+            if route is None:
+                return None
+            path += route
+            state = route[-1].target
+            for edge in route:
+                uncovered -= edge.covers
+        return path
+
+    def _route_to_coverage(self, start: str, uncovered: set[int]) -> list[Transition] | None:
+        routes = {start: []}
+        queue = deque([start])
+        while queue:
+            state = queue.popleft()
+            edges = self.transitions.get(state, [])
+            best = max(edges, key=lambda edge: len(edge.covers & uncovered), default=None)
+            if best and best.covers & uncovered:
+                return routes[state] + [best]
+            for edge in self.transitions.get(state, []):
+                if edge.target not in routes:
+                    routes[edge.target] = routes[state] + [edge]
+                    queue.append(edge.target)
+        return None
+
+    @staticmethod
+    def replay(path: list[Transition], tracestate: TraceState):
+        """Inserts the scenarios along the path into tracestate, as if they were found by searching"""
+        names = {}
+        for edge in path:
+            for ins in edge.insertions:
+                if not tracestate.is_refinement_active(ins.index):
+                    rep_count = tracestate.count(ins.index)
+                    names[ins.index] = f"{ins.scenario.name} (rep {rep_count+1})" if rep_count else ins.scenario.name
+                scenario = ins.scenario.derive()
+                if ins.remainder is None:
+                    scenario.name = names[ins.index]
+                    tracestate.confirm_full_scenario(ins.index, scenario, ins.model)
+                else:
+                    scenario.name = f"{names[ins.index]} (part {tracestate.highest_part(ins.index)+1})"
+                    tracestate.push_partial_scenario(ins.index, scenario, ins.model, ins.remainder)
+
+    def log_summary(self):
+        limits = [f"max_depth={self.max_depth}", f"max_states={self.max_states}"]
+        if self.max_refinement_depth:
+            limits.append(f"max_refinement_depth={self.max_refinement_depth}")
+        logger.info(f"Explored {len(self.states)} model states with {self.n_transitions} transitions"
+                    + ("" if self.complete else f" (exploration limited to {', '.join(limits[:-1])} and {limits[-1]})"))
+        numbers = {state: n for n, state in enumerate(self.states)}
+        for state, edges in self.transitions.items():
+            logger.debug(f"state {numbers[state]}:\n{state}\t" + "\n\t".join(
+                [f"scenario {edge.index} -> state {numbers[edge.target]}" for edge in edges]))
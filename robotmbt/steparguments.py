@@ -31,23 +31,51 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 from enum import Enum, auto
+from functools import lru_cache
 from keyword import iskeyword
 from typing import Any
 import builtins
+import itertools
+import re
+
+# Every assignment of an argument value gets a new stamp, used to detect changes in cached texts
+_value_stamps = itertools.count()
+
+
+@lru_cache(maxsize=4096)
+def _fill_in_template(text: str, args: tuple[str, ...]) -> list[str]:
+    """
+    Splits text into literal parts and argument references. Argument references are at the odd
+    positions of the returned list.
+    """
+    return re.split('(' + '|'.join(re.escape(arg) for arg in args) + ')', text)
 
 
 class StepArguments(list):
+    __slots__ = ()
+
     def __init__(self, iterable=[]):
         super().__init__(item.copy() for item in iterable)
 
     def fill_in_args(self, text: str, as_code: bool = False) -> str:
-        result = text
+        if not self or '{' not in text:
+            return text
+        parts = _fill_in_template(text, tuple(arg.arg for arg in self))
+        if len(parts) == 1:
+            return text
+        subs = {}
         for arg in self:
-            sub = arg.codestring if as_code else str(arg.value)
-            result = result.replace(arg.arg, sub)
-        return result
+            subs.setdefault(arg.arg, arg.codestring if as_code else str(arg.value))
+        return ''.join(subs[part] if i % 2 else part for i, part in enumerate(parts))
+
+    @property
+    def revision(self) -> tuple[int, ...]:
+        """Changes whenever an argument in the set is assigned a value"""
+        return tuple(arg.stamp for arg in self)
 
     def __getitem__(self, key):
+        if isinstance(key, int):
+            return super().__getitem__(key)
         for steparg in self:
             if key.casefold() == steparg.arg.casefold():
                 return steparg
@@ -55,7 +83,7 @@ class StepArguments(list):
 
     @property
     def modified(self) -> bool:
-        return any([arg.modified for arg in self])
+        return any(arg.modified for arg in self)
 
 
 class ArgKind(Enum):
@@ -68,6 +96,8 @@ class ArgKind(Enum):
 
 
 class StepArgument:
+    __slots__ = ('name', 'org_value', 'kind', '_value', '_codestr', 'is_default', 'stamp')
+
     def __init__(self, arg_name: str, value: Any, kind: ArgKind = ArgKind.UNKNOWN, is_default: bool = False):
         self.name: str = arg_name
         self.org_value: Any = value
@@ -92,6 +122,7 @@ class StepArgument:
         self._value: Any = value
         self._codestr = self.make_codestring(value)
         self.is_default = False
+        self.stamp: int = next(_value_stamps)
 
     @property
     def modified(self) -> bool:
@@ -102,8 +133,10 @@ class StepArgument:
         return self._codestr
 
     def copy(self):
-        cp = StepArgument(self.arg.strip('${}'), self.value, self.kind, self.is_default)
-        cp.org_value = self.org_value
+        cp = StepArgument.__new__(StepArgument)
+        for attr in StepArgument.__slots__:
+            setattr(cp, attr, getattr(self, attr))
+        cp.name = self.arg.strip('${}')
         return cp
 
     def __str__(self):
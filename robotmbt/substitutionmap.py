@@ -30,8 +30,14 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import itertools
 import random
-from typing import Any
+from collections import deque
+from collections.abc import Sequence
+from typing import Any, Callable, Iterable, Iterator
+
+# Option sets up to this size are always built in memory, see is_lazy_domain()
+LAZY_DOMAIN_SIZE = 10_000
 
 
 class SubstitutionMap:
@@ -46,6 +52,7 @@ class SubstitutionMap:
     def __init__(self):
         self.substitutions = {}  # {example_value:Constraint}
         self.solution = {}       # {example_value:solution_value}
+        self.domain = OptionDomain()  # Shared by all constraints in this map and its copies
 
     def __str__(self):
         src = self.solution or self.substitutions
@@ -53,80 +60,286 @@ class SubstitutionMap:
 
     def copy(self):
         new = SubstitutionMap()
+        new.domain = self.domain
         new.substitutions = {k: v.copy() for k, v in self.substitutions.items()}
         new.solution = self.solution.copy()
         return new
 
-    def substitute(self, example_value: str, constraint: list[Any]):
+    def substitute(self, example_value: str, constraint: list[Any] | Sequence[Any]):
         self.solution = {}
-        if example_value in self.substitutions:
-            self.substitutions[example_value].add_constraint(constraint)
+        if example_value not in self.substitutions:
+            self.substitutions[example_value] = LazyConstraint(constraint) if is_lazy_domain(constraint) \
+                else Constraint(constraint, self.domain)
         else:
-            self.substitutions[example_value] = Constraint(constraint)
+            self.substitutions[example_value].add_constraint(constraint)
+        constraint = self.substitutions[example_value]
+        if isinstance(constraint, LazyConstraint) and not is_lazy_domain(constraint.shortest):
+            # Narrowed down far enough to use a regular option list
+            options = list(constraint)
+            if not options:
+                raise ValueError('No options left after adding constraint')
+            self.substitutions[example_value] = Constraint(options, self.domain)
 
-    def solve(self) -> dict[str, str]:
+    def solve(self, choose: Callable[[str, list[Any], dict[str, Any]], Any] | None = None) -> dict[str, str]:
+        """
+        Picks a value at random for each example value, starting with the example values
+        that have the fewest options left. A choice is only accepted if all remaining example
+        values can still get a unique value of their own. This is verified by maintaining a
+        matching between example values and options, so that no backtracking is needed.
+        Example values with a lazy domain are solved last, by sampling from their domain.
+
+        Instead of picking at random, choose can pick from the remaining options, given the
+        example value, its options and the solution so far.
+        """
         self.solution = {}
+        if choose is None:
+            def choose(example_value, remaining_options, partial_solution):
+                return random.choice(remaining_options)
+        options = {example_value: list(constraint.optionset)
+                   for example_value, constraint in self.substitutions.items()
+                   if not isinstance(constraint, LazyConstraint)}
+        matching = _maximum_matching(options)
+        if len(matching) < len(options):
+            raise ValueError("No solution found within the set of given constraints")
+        owners = {value: example_value for example_value, value in matching.items()}
+
+        # The list is sorted again after each choice. The sort is stable, so ties in the number of
+        # options keep their order from the previous sort, starting with the order of declaration.
+        unsolved = list(options)
         solution: dict[str, str] = dict()
-        substitutions = self.copy().substitutions
-        unsolved_subs = list(substitutions)
-        subs_stack = []
+        while unsolved:
+            unsolved.sort(key=lambda e: len(options[e]))
+            example_value = unsolved.pop(0)
+            choice = choose(example_value, options[example_value], solution)
+            while not _rematch(example_value, choice, options, matching, owners):
+                # No unique values left for the others when using this choice
+                options[example_value].remove(choice)
+                choice = choose(example_value, options[example_value], solution)
+            solution[example_value] = choice
 
-        while unsolved_subs:
-            unsolved_subs.sort(key=lambda i: len(substitutions[i].optionset))
-            example_value = unsolved_subs[0]
-            solution[example_value] = random.choice(substitutions[example_value].optionset)
-            subs_stack.append(example_value)
-            others_list = []
+            # forward checking, exclude the choice from all others
+            for other in unsolved:
+                if choice in options[other]:
+                    options[other].remove(choice)
 
-            try:
-                # exclude the choice from all others
-                for other in [e for e in substitutions if e != example_value]:
-                    others_list.append(other)
-                    substitutions[other].remove_option(solution[example_value])
-                unsolved_subs.pop(0)
-            except ValueError:
-                # wrong choice, it depleted the last option for another example value
-                for affected_other in others_list:
-                    substitutions[affected_other].undo_remove()
-                # roll back last choice
-                solution.pop(example_value)
-                subs_stack.pop()
-                rollback_done = False
-                while not rollback_done:
-                    try:
-                        while subs_stack[-1] == example_value:
-                            substitutions[example_value].undo_remove()
-                            subs_stack.pop()
-                    except IndexError:
-                        # nothing left to roll back, no options remaining
-                        raise ValueError("No solution found within the set of given constraints")
-                    last_item = subs_stack[-1]
-                    unsolved_subs.insert(0, last_item)
-                    for other in [e for e in substitutions if e != last_item]:
-                        substitutions[other].undo_remove()
-                    try:
-                        substitutions[last_item].remove_option(solution.pop(last_item))
-                        rollback_done = True
-                    except ValueError:
-                        # next level must also be rolled back
-                        example_value = last_item
+        for example_value, constraint in self.substitutions.items():
+            if isinstance(constraint, LazyConstraint):
+                solution[example_value] = constraint.sample(exclude=list(solution.values()))
 
         self.solution = solution
         return solution
 
+    def iter_solutions(self) -> Iterator[dict[str, Any]]:
+        """
+        Yields all distinct solutions, one at a time, in a random order that is determined by
+        the random seed. Solutions are only built when requested. Partial solutions that cannot
+        be completed are cut off early, using the same matching check as solve().
+        """
+        yield from self._enumerate(shuffle=True)
+
+    def count_solutions(self, limit: int | None = None) -> int:
+        """
+        Counts the number of distinct solutions, stopping at limit if given. A limit is
+        required when any of the example values have a lazy domain, and must be at least 1.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"Limit for counting solutions must be at least 1, got {limit}")
+        if limit is None and any(isinstance(c, LazyConstraint) for c in self.substitutions.values()):
+            raise ValueError("Counting solutions for lazy option sets requires a limit")
+        count = 0
+        for _ in self._enumerate(shuffle=False):
+            count += 1
+            if count == limit:
+                break
+        return count
+
+    def _enumerate(self, shuffle: bool) -> Iterator[dict[str, Any]]:
+        options = {example_value: list(constraint.optionset)
+                   for example_value, constraint in self.substitutions.items()
+                   if not isinstance(constraint, LazyConstraint)}
+        lazy = {example_value: constraint for example_value, constraint in self.substitutions.items()
+                if isinstance(constraint, LazyConstraint)}
+        if len(_maximum_matching(options)) < len(options):
+            return
+        for partial in _enumerate_options(options, {}, shuffle):
+            for solution in _enumerate_lazy(list(lazy.items()), partial, shuffle):
+                yield {example_value: solution[example_value] for example_value in self.substitutions}
+
+
+def _enumerate_options(options: dict[str, list[Any]], partial: dict[str, Any],
+                       shuffle: bool) -> Iterator[dict[str, Any]]:
+    """Depth-first search over all complete assignments of options, fewest options first"""
+    if not options:
+        yield partial.copy()
+        return
+    example_value = min(options, key=lambda e: len(options[e]))
+    choices = random.sample(options[example_value], len(options[example_value])) if shuffle \
+        else options[example_value]
+    for choice in choices:
+        remaining = {other: [opt for opt in opts if opt != choice]
+                     for other, opts in options.items() if other != example_value}
+        if any(not opts for opts in remaining.values()):
+            continue
+        if len(_maximum_matching(remaining)) < len(remaining):
+            continue
+        partial[example_value] = choice
+        yield from _enumerate_options(remaining, partial, shuffle)
+        del partial[example_value]
+
+
+def _enumerate_lazy(lazy: list[tuple[str, 'LazyConstraint']], partial: dict[str, Any],
+                    shuffle: bool) -> Iterator[dict[str, Any]]:
+    """Extends the partial solution with all options from lazy domains, without building them"""
+    if not lazy:
+        yield partial.copy()
+        return
+    (example_value, constraint), others = lazy[0], lazy[1:]
+    shortest = constraint.shortest
+    start = random.randrange(len(shortest)) if shuffle and len(shortest) else 0
+    for i in itertools.chain(range(start, len(shortest)), range(start)):
+        choice = shortest[i]
+        if choice in constraint and choice not in partial.values():
+            partial[example_value] = choice
+            yield from _enumerate_lazy(others, partial, shuffle)
+            del partial[example_value]
+
+
+def _maximum_matching(options: dict[str, list[Any]]) -> dict[str, Any]:
+    """
+    Hopcroft-Karp algorithm for finding a maximum bipartite matching between example values and
+    their options. Returns the matched option for each example value that could be matched.
+    """
+    matching: dict[str, Any] = {}
+    owners: dict[Any, str] = {}
+
+    def augment(example_value: str) -> bool:
+        for value in options[example_value]:
+            owner = owners.get(value)
+            if owner is None or (layers.get(owner) == layers[example_value] + 1 and augment(owner)):
+                matching[example_value] = value
+                owners[value] = example_value
+                return True
+        layers[example_value] = None  # dead end, skip in further searches this phase
+        return False
+
+    while True:
+        # breadth-first search for the layers of alternating paths starting from unmatched example values
+        layers = {example_value: 0 for example_value in options if example_value not in matching}
+        queue = deque(layers)
+        free_option_found = False
+        while queue:
+            example_value = queue.popleft()
+            for value in options[example_value]:
+                owner = owners.get(value)
+                if owner is None:
+                    free_option_found = True
+                elif owner not in layers:
+                    layers[owner] = layers[example_value] + 1
+                    queue.append(owner)
+        if not free_option_found:
+            return matching
+        for example_value in [e for e in options if e not in matching]:
+            augment(example_value)
+
+
+def _rematch(example_value: str, choice: Any, options: dict[str, list[Any]],
+             matching: dict[str, Any], owners: dict[Any, str]) -> bool:
+    """
+    Updates the complete matching, such that example_value is matched with choice. The example
+    value that previously held choice looks for an alternative via an augmenting path. Returns
+    False, leaving the matching unchanged, if no complete matching includes this choice.
+    """
+    previous = matching[example_value]
+    if previous == choice:
+        return True
+    displaced = owners.get(choice)
+    del owners[previous]
+    if displaced is None:
+        matching[example_value] = choice
+        owners[choice] = example_value
+        return True
+
+    # breadth-first search for an augmenting path for the displaced example value
+    reached_via: dict[Any, str] = {}
+    visited = {example_value, displaced}
+    queue = deque([displaced])
+    while queue:
+        current = queue.popleft()
+        for value in options[current]:
+            if value == choice or value in reached_via:
+                continue
+            reached_via[value] = current
+            owner = owners.get(value)
+            if owner is None:
+                matching[example_value] = choice
+                owners[choice] = example_value
+                # flip the matching along the path
+                while True:
+                    current = reached_via[value]
+                    next_value = matching.get(current)
+                    matching[current] = value
+                    owners[value] = current
+                    if current == displaced:
+                        return True
+                    value = next_value
+            if owner not in visited:
+                visited.add(owner)
+                queue.append(owner)
+    owners[previous] = example_value
+    return False
+
+
+class OptionDomain:
+    """
+    Interning table for option values. Each distinct value gets a fixed index, which allows
+    constraints to represent their options as a bitmask. Values are only ever added, so a
+    domain can be shared by all constraints in a substitution map and its copies.
+    """
+
+    def __init__(self):
+        self.values: list[Any] = []
+        self.index: dict[Any, int] = {}
+
+    def intern(self, values: Iterable[Any]) -> list[int]:
+        """Returns the indices for values, in order of first occurrence. Adds unknown values."""
+        indices = []
+        for value in values:
+            if value not in self.index:
+                self.index[value] = len(self.values)
+                self.values.append(value)
+            indices.append(self.index[value])
+        return list(dict.fromkeys(indices))
+
+    def mask(self, values: Iterable[Any]) -> int:
+        """Returns the bitmask for values. Values that are not in the domain are ignored."""
+        mask = 0
+        for value in values:
+            try:
+                mask |= 1 << self.index[value]
+            except (KeyError, TypeError):
+                pass
+        return mask
+
 
 class Constraint:
-    def __init__(self, constraint: list[Any]):
+    def __init__(self, constraint: list[Any], domain: OptionDomain | None = None):
+        self.domain: OptionDomain = domain or OptionDomain()
         try:
-            # Keep the items in optionset unique. Refrain from using Python sets
-            # due to non-deterministic behaviour when using random seeding.
-            self.optionset: list[Any] | None = list(dict.fromkeys(constraint))
+            # Keep the items in the option set unique, in order of appearance. Refrain from
+            # using Python sets due to non-deterministic behaviour when using random seeding.
+            self._order: list[int] = self.domain.intern(constraint)
         except:
-            self.optionset: list[Any] | None = None
-        if not self.optionset or isinstance(constraint, str):
+            self._order = []
+        if not self._order or isinstance(constraint, str):
             raise ValueError(f"Invalid option set for initial constraint: {constraint}")
+        self._mask: int = self.domain.mask(self.domain.values[i] for i in self._order)
+
+        self.removed_stack: list[int | Placeholder] = []
 
-        self.removed_stack: list[str | Placeholder] = []
+    @property
+    def optionset(self) -> list[Any]:
+        """The options that are still available, in their original order"""
+        return [self.domain.values[i] for i in self._order if self._mask >> i & 1]
 
     def __repr__(self):
         return f'Constraint([{", ".join([str(e) for e in self.optionset])}])'
@@ -135,28 +348,128 @@ class Constraint:
         return iter(self.optionset)
 
     def copy(self):
-        return Constraint(self.optionset)
+        new = Constraint.__new__(Constraint)
+        new.domain = self.domain
+        new._order = [i for i in self._order if self._mask >> i & 1]
+        new._mask = self._mask
+        new.removed_stack = []
+        return new
 
     def add_constraint(self, constraint: list[Any] | None):
         if constraint is None:
             return
-        self.optionset = [opt for opt in self.optionset if opt in constraint]
-        if not len(self.optionset):
+        if is_lazy_domain(constraint):
+            self._mask &= self.domain.mask([opt for opt in self.optionset if opt in constraint])
+        else:
+            self._mask &= self.domain.mask(constraint)
+        if not self._mask:
             raise ValueError('No options left after adding constraint')
 
     def remove_option(self, option: str):
-        try:
-            self.optionset.remove(option)
-            self.removed_stack.append(option)
-        except ValueError:
+        bit = self.domain.mask([option]) & self._mask
+        if bit:
+            self._mask &= ~bit
+            self.removed_stack.append(bit)
+        else:
             self.removed_stack.append(Placeholder)
-        if not len(self.optionset):
+        if not self._mask:
             raise ValueError('No options left after adding constraint')
 
     def undo_remove(self):
         last_item = self.removed_stack.pop()
-        if last_item is not Placeholder and last_item not in self.optionset:
-            self.optionset.append(last_item)
+        if last_item is not Placeholder:
+            self._mask |= last_item
+
+
+class LazyConstraint:
+    """
+    Constraint on a large sequence of options, like a range, that is never built in memory.
+    Further lazy constraints narrow the options down to the intersection of all sequences.
+    Options are picked by sampling at random from the shortest sequence and checking the
+    candidate against the other sequences and the removed options.
+    """
+    MAX_SAMPLES = 1000  # Random attempts before falling back to a full scan of the sequence
+
+    def __init__(self, constraint: Sequence[Any]):
+        if not is_lazy_domain(constraint):
+            raise ValueError(f"Invalid lazy option set for initial constraint: {constraint}")
+        self.sequences: list[Sequence[Any]] = [constraint]
+        self.removed_stack: list[Any] = []
+
+    def __repr__(self):
+        removed = [opt for opt in self.removed_stack if opt is not Placeholder]
+        return f'Constraint({" & ".join(map(repr, self.sequences))}{f" - {removed}" if removed else ""})'
+
+    def __contains__(self, option: Any) -> bool:
+        return all(option in seq for seq in self.sequences) and option not in self.removed_stack
+
+    def __iter__(self):
+        return (opt for opt in self.shortest if opt in self)
+
+    @property
+    def shortest(self) -> Sequence[Any]:
+        return min(self.sequences, key=len)
+
+    def copy(self):
+        new = LazyConstraint.__new__(LazyConstraint)
+        new.sequences = self.sequences[:]
+        new.removed_stack = self.removed_stack[:]
+        return new
+
+    def add_constraint(self, constraint: list[Any] | Sequence[Any] | None):
+        if constraint is None:
+            return
+        if not is_lazy_domain(constraint):
+            constraint = list(dict.fromkeys(constraint))
+        for i, seq in enumerate(self.sequences):
+            overlap = _range_intersection(seq, constraint)
+            if overlap is not None:
+                self.sequences[i] = overlap
+                return
+        self.sequences.append(constraint)
+
+    def remove_option(self, option: Any):
+        self.removed_stack.append(option if option in self else Placeholder)
+
+    def undo_remove(self):
+        self.removed_stack.pop()
+
+    def sample(self, exclude: list[Any]) -> Any:
+        """Returns a random option from this constraint that is not in exclude"""
+        shortest = self.shortest
+        if len(shortest):
+            for _ in range(self.MAX_SAMPLES):
+                option = shortest[random.randrange(len(shortest))]
+                if option in self and option not in exclude:
+                    return option
+        # Few options are left, use reservoir sampling for a single pass over all options
+        n_found = 0
+        for candidate in self:
+            if candidate not in exclude:
+                n_found += 1
+                if random.randrange(n_found) == 0:
+                    option = candidate
+        if not n_found:
+            raise ValueError("No solution found within the set of given constraints")
+        return option
+
+
+def _range_intersection(a: Sequence[Any], b: Sequence[Any]) -> range | None:
+    """Intersects two ranges with the same positive step. Returns None for other sequences."""
+    if not (isinstance(a, range) and isinstance(b, range)) or a.step != b.step or a.step < 0:
+        return None
+    if (a.start - b.start) % a.step:
+        return range(0)
+    return range(max(a.start, b.start), min(a.stop, b.stop), a.step)
+
+
+def is_lazy_domain(options: Any) -> bool:
+    """
+    Sequences, other than lists and tuples, with more than LAZY_DOMAIN_SIZE options are not
+    built in memory. This includes range objects and custom sequence types.
+    """
+    return (isinstance(options, Sequence) and not isinstance(options, (list, tuple, str, bytes))
+            and len(options) > LAZY_DOMAIN_SIZE)
 
 
 class Placeholder:
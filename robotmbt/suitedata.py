@@ -31,7 +31,7 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import copy
-from typing import Literal, Any
+from typing import Literal, Any, Iterator
 
 from robot.running.arguments.argumentspec import ArgumentSpec
 from robot.running.arguments.argumentvalidator import ArgumentValidator
@@ -51,6 +51,9 @@ class Suite:
         self.scenarios: list[Scenario] = []
         self.setup: Step | None = None  # Can be a single step or None
         self.teardown: Step | None = None  # Can be a single step or None
+        # In online mode, further scenarios are generated while the suite is running. The
+        # feed yields the next batch of scenarios each time the previous batch is executed.
+        self.scenario_feed: Iterator[list[Scenario]] | None = None
 
     @property
     def longname(self) -> str:
@@ -80,6 +83,7 @@ class Scenario:
         self.steps: list[Step] = []
         self.src_id: int | None = None
         self.data_choices: SubstitutionMap = SubstitutionMap()
+        self.modifier_plan: list | None = None  # Compiled :MOD: expressions, see modeller.get_modifier_plan()
 
     @property
     def longname(self) -> str:
@@ -101,6 +105,22 @@ class Scenario:
         duplicate.data_choices = self.data_choices.copy()
         return duplicate
 
+    def derive(self):
+        """
+        Returns a lightweight copy of the scenario that shares its steps with this scenario.
+        Shared steps must not be modified. Use own_step() to get a private copy of a step before
+        modifying it, or use copy() to get a fully independent scenario.
+        """
+        duplicate = copy.copy(self)
+        duplicate.steps = self.steps[:]
+        duplicate.data_choices = self.data_choices.copy()
+        return duplicate
+
+    def own_step(self, stepindex: int):
+        """Replaces the step at stepindex by a private copy, that can be modified safely, and returns it"""
+        self.steps[stepindex] = self.steps[stepindex].copy()
+        return self.steps[stepindex]
+
     def split_at_step(self, stepindex: int):
         """Returns 2 partial scenarios.
 
@@ -108,18 +128,28 @@ class Scenario:
         stepindex 1 the first step is in the first part, the other in the last part, and so on.
         """
         assert stepindex <= len(self.steps), "Split index out of range. Not enough steps in scenario."
-        front = self.copy()
+        front = self.derive()
+        front.modifier_plan = None
         front.teardown = None
         front.steps = self.steps[:stepindex]
-        back = self.copy()
+        back = self.derive()
+        back.modifier_plan = None
         back.steps = self.steps[stepindex:]
         back.setup = None
         return front, back
 
 
 class Step:
+    # Steps exist in large numbers, once for every step in every scenario in the trace
+    __slots__ = ('org_step', 'org_pn_args', 'parent', 'assign', '_gherkin_kw', 'signature', 'args', 'detached',
+                 'model_info', '_keyword_cache', '_posnom_cache', '_step_kw_cache')
+
     def __init__(self, steptext: str, *args, parent: Suite | Scenario, assign: tuple[str] = (),
                  prev_gherkin_kw: Literal['given', 'when', 'then'] | None = None):
+        # Texts derived from the step are cached as (inputs, text), until any of the inputs change
+        self._keyword_cache: tuple[Any, str] | None = None
+        self._posnom_cache: tuple[Any, tuple[str, ...]] | None = None
+        self._step_kw_cache: tuple[str, str | None] | None = None
         # org_step is the first keyword cell of the Robot line, including step_kw,
         # excluding positional args, excluding variable assignment.
         self.org_step: str = steptext
@@ -175,14 +205,26 @@ class Step:
     def keyword(self) -> str:
         if not self.signature:
             return self.org_step
+        inputs = (self.org_step, self.signature, self.args.revision)
+        if self._keyword_cache and self._keyword_cache[0] == inputs:
+            return self._keyword_cache[1]
         s = f"{self.step_kw} {self.signature}" if self.step_kw else self.signature
-        return self.args.fill_in_args(s)
+        keyword = self.args.fill_in_args(s)
+        self._keyword_cache = (inputs, keyword)
+        return keyword
 
     @property
     def posnom_args_str(self) -> tuple[str, ...]:
         """A tuple with all arguments in Robot accepted text format ('posA' , 'posB', 'named1=namedA')"""
         if self.detached or not self.args.modified:
             return self.org_pn_args
+        if self._posnom_cache and self._posnom_cache[0] == self.args.revision:
+            return self._posnom_cache[1]
+        result = self.__render_posnom_args()
+        self._posnom_cache = (self.args.revision, result)
+        return result
+
+    def __render_posnom_args(self) -> tuple[str, ...]:
         result: list[Any] = []
         for arg in self.args:
             if arg.is_default:
@@ -210,8 +252,12 @@ class Step:
 
     @property
     def step_kw(self) -> str | None:
+        if self._step_kw_cache and self._step_kw_cache[0] is self.org_step:
+            return self._step_kw_cache[1]
         first_word = self.org_step.split()[0]
-        return first_word if first_word.lower() in ['given', 'when', 'then', 'and', 'but'] else None
+        step_kw = first_word if first_word.lower() in ['given', 'when', 'then', 'and', 'but'] else None
+        self._step_kw_cache = (self.org_step, step_kw)
+        return step_kw
 
     @property
     def kw_wo_gherkin(self) -> str:
@@ -32,28 +32,41 @@
 
 import copy
 import random
-from typing import Any
+import time
+from typing import Any, Iterator
 
 from robot.api import logger
+from robot.utils import timestr_to_secs
 
 from . import modeller
+from .datacoverage import DataCoverage, parse_data_coverage
+from .dependencies import DependencyAnalysis
 from .modelspace import ModelSpace
-from .suitedata import Suite, Scenario
+from .stategraph import StateGraph
+from .suitedata import Suite, Scenario, Step
 from .tracestate import TraceState
 
 
-try:
-    from .visualise.visualiser import Visualiser
-    from .visualise.models import TraceInfo
-
-    visualisation_deps_present = True
-except ImportError:
-    Visualiser = None
-    TraceInfo = None
-    visualisation_deps_present = False
+def _import_visualisation() -> tuple[type, type] | tuple[None, None]:
+    """
+    Imports the visualisation package on first use, instead of at library import, because its
+    dependencies take long to load. Returns (None, None) if the optional dependencies are not installed.
+    """
+    try:
+        from .visualise.visualiser import Visualiser
+        from .visualise.models import TraceInfo
+    except ImportError:
+        return None, None
+    return Visualiser, TraceInfo
 
 
 class SuiteProcessors:
+    SOAK_WINDOW = 10  # Number of scenarios that remain available for rewinding in soak mode
+    EXPLORE_DEPTH = 25  # Default number of scenarios from the initial state up to which explore mode looks
+    EXPLORE_STATES = 1000  # Default number of model states after which explore mode stops looking
+    data_coverage_strength: int = 0  # t for t-wise data coverage, 0 when not in use
+    max_refinement_depth: int = 0  # Maximum number of nested open refinements, 0 for unlimited
+
     @staticmethod
     def echo(in_suite: Suite) -> Suite:
         return in_suite
@@ -63,33 +76,60 @@ class SuiteProcessors:
         Takes a Suite as input and returns a Suite as output. The output Suite does not
         have any sub-suites, only scenarios. The scenarios do not have a setup. Any setup
         keywords are inserted at the front of the scenario as regular steps.
+
+        The input suite is left unchanged. The flattened scenarios share their steps with the
+        scenarios in the input suite, only the scenarios and their lists of steps are new.
         """
-        out_suite = copy.deepcopy(in_suite)
-        outer_scenarios = out_suite.scenarios
-        for scenario in outer_scenarios:
-            if scenario.setup:
-                scenario.steps.insert(0, scenario.setup)
-                scenario.setup = None
-            if scenario.teardown:
-                scenario.steps.append(scenario.teardown)
-                scenario.teardown = None
-
-        out_suite.scenarios = []
-        for suite in in_suite.suites:
-            subsuite = self.flatten(suite)
-            for scenario in subsuite.scenarios:
-                if subsuite.setup:
-                    scenario.steps.insert(0, subsuite.setup)
-                if subsuite.teardown:
-                    scenario.steps.append(subsuite.teardown)
-            out_suite.scenarios.extend(subsuite.scenarios)
-
-        out_suite.scenarios.extend(outer_scenarios)
+        out_suite = copy.copy(in_suite)
+        out_suite.scenarios = list(self._iter_flat_scenarios(in_suite))
         out_suite.suites = []
         return out_suite
 
+    def _iter_flat_scenarios(self, suite: Suite, setups: tuple[Step, ...] = (),
+                             teardowns: tuple[Step, ...] = ()) -> Iterator[Scenario]:
+        """Yields the scenarios of all sub-suites, followed by the suite's own scenarios"""
+        for subsuite in suite.suites:
+            yield from self._iter_flat_scenarios(subsuite,
+                                                 setups + ((subsuite.setup,) if subsuite.setup else ()),
+                                                 ((subsuite.teardown,) if subsuite.teardown else ()) + teardowns)
+        for scenario in suite.scenarios:
+            flat_scenario = scenario.derive()
+            flat_scenario.modifier_plan = None
+            flat_scenario.steps = [*setups, *([scenario.setup] if scenario.setup else []), *scenario.steps,
+                                   *([scenario.teardown] if scenario.teardown else []), *teardowns]
+            flat_scenario.setup = None
+            flat_scenario.teardown = None
+            yield flat_scenario
+
     def process_test_suite(self, in_suite: Suite, *, seed: str | int | bytes | bytearray = 'new',
-                           graph: str = '', export_graph_data: str = '', import_graph_data: str = '') -> Suite:
+                           graph: str = '', export_graph_data: str = '', import_graph_data: str = '',
+                           mode: str = 'offline', max_steps: int | str = 0,
+                           max_duration: str | int | float = 0, chunk_size: int | str = 0,
+                           shards: int | str = 1, shard: int | str = 1, data_coverage: str = '',
+                           max_depth: int | str = 0, max_states: int | str = 0,
+                           max_refinement_depth: int | str = 0) -> Suite:
+        if mode not in ('offline', 'online', 'soak', 'explore'):
+            raise ValueError(f"Unknown mode '{mode}'. Supported modes are: offline, online, soak, explore")
+        if int(chunk_size) and mode not in ('offline', 'explore'):
+            raise ValueError("Option chunk_size is only available in offline and explore mode")
+        if (int(max_depth) or int(max_states)) and mode != 'explore':
+            raise ValueError("Options max_depth and max_states are only available in explore mode")
+        self.max_refinement_depth = int(max_refinement_depth)
+        if self.max_refinement_depth < 0:
+            raise ValueError(f"Option max_refinement_depth cannot be negative, got {max_refinement_depth}")
+        shards, shard = int(shards), int(shard)
+        if shards > 1:
+            if mode not in ('offline', 'explore') or int(chunk_size):
+                raise ValueError("Sharding is only available in offline and explore mode without chunk_size")
+            if str(seed).strip().lower() in ('new', 'none'):
+                raise ValueError("Sharding requires a fixed seed, so that all shards split the same trace")
+            if not 1 <= shard <= shards:
+                raise ValueError(f"Shard must be a number from 1 to {shards}, not {shard}")
+        if mode == 'soak' and not (max_steps or max_duration):
+            raise ValueError("Soak mode requires a limit. Use max_steps and/or max_duration.")
+        self.data_coverage_strength = parse_data_coverage(data_coverage)
+        if self.data_coverage_strength and mode != 'offline':
+            raise ValueError("Option data_coverage is only available in offline mode")
         self.out_suite = Suite(in_suite.name)
         self.out_suite.filename = in_suite.filename
         self.out_suite.parent = in_suite.parent
@@ -99,19 +139,38 @@ class SuiteProcessors:
         if import_graph_data != '':
             self._load_graph(graph, in_suite.name, import_graph_data)
 
+        elif mode in ('online', 'soak'):
+            self._prepare_test_suite(seed, graph, in_suite.name, export_graph_data)
+            if mode == 'online':
+                feed = self._online_trace()
+            else:
+                feed = self._soak_trace(int(max_steps), timestr_to_secs(max_duration))
+            self.out_suite.scenarios = next(feed, [])
+            self.out_suite.scenario_feed = feed
+            return self.out_suite
+
+        elif mode == 'explore':
+            self._explore_test_suite(seed, graph, in_suite.name, export_graph_data,
+                                     int(max_depth) or self.EXPLORE_DEPTH, int(max_states) or self.EXPLORE_STATES,
+                                     int(chunk_size), shards, shard)
+
         else:
-            self._run_test_suite(seed, graph, in_suite.name, export_graph_data)
+            self._run_test_suite(seed, graph, in_suite.name, export_graph_data, int(chunk_size), shards, shard)
 
         self.__write_visualisation()
 
         return self.out_suite
 
     def _load_graph(self, graph: str, suite_name: str, from_json: str):
+        Visualiser, TraceInfo = _import_visualisation()
+        if Visualiser is None:
+            raise ImportError("Importing graph data requires the visualisation dependencies. "
+                              "Refer to the README on how to install these dependencies.")
         traceinfo = TraceInfo()
         traceinfo = traceinfo.import_graph(from_json)
         self.visualiser = Visualiser(graph, suite_name, trace_info=traceinfo)
 
-    def _run_test_suite(self, seed: str | int | bytes | bytearray, graph: str, suite_name: str, export_dir: str):
+    def _prepare_test_suite(self, seed: str | int | bytes | bytearray, graph: str, suite_name: str, export_dir: str):
         for id, scenario in enumerate(self.flat_suite.scenarios, start=1):
             scenario.src_id = id
         self.scenarios: list[Scenario] = self.flat_suite.scenarios[:]
@@ -121,33 +180,250 @@ class SuiteProcessors:
         self._init_randomiser(seed)
         self.shuffled: list[int] = [s.src_id for s in self.scenarios]
         random.shuffle(self.shuffled)  # Keep a single shuffle for all TraceStates (non-essential)
+        self.dependencies = DependencyAnalysis(self.scenarios)
+        # Candidates are tried in order of dependency depth, starting with those that fit an empty model
+        self.shuffled.sort(key=lambda index: self.dependencies.depth.get(index, len(self.scenarios)))
+        logger.debug("Scenario dependencies\n\t" + "\n\t".join(
+            [f"{index}: depth {self.dependencies.depth.get(index, '-')}, depends on {sorted(providers)}"
+             for index, providers in self.dependencies.depends_on.items()]))
+        if self.dependencies.equivalents:
+            logger.debug("Equivalent scenarios: " + ", ".join(sorted(
+                {str(sorted([index, *others])) for index, others in self.dependencies.equivalents.items()})))
 
         self.visualiser = None
-        if visualisation_deps_present and (graph or export_dir):
+        Visualiser, _ = _import_visualisation() if graph or export_dir else (None, None)
+        if Visualiser is not None:
             try:
                 self.visualiser = Visualiser(graph, suite_name, export_dir)
             except Exception as e:
                 self.visualiser = None
                 logger.warn(f'Could not initialise visualiser due to error!\n{e}')
 
-        elif (not graph or not export_dir) and not visualisation_deps_present:
+        elif graph or export_dir:
             logger.warn(f'Visualisation {graph} requested, but required dependencies are not installed. '
                         'Refer to the README on how to install these dependencies. ')
 
+    def _run_test_suite(self, seed: str | int | bytes | bytearray, graph: str, suite_name: str, export_dir: str,
+                        chunk_size: int = 0, shards: int = 1, shard: int = 1):
+        self._prepare_test_suite(seed, graph, suite_name, export_dir)
+        self._fail_on_unreachable_scenarios()
+
+        clusters = self._independent_clusters()
+        if len(clusters) > 1:
+            logger.info(f"Composing the trace from {len(clusters)} independent clusters of scenarios")
+            tracestate = TraceState(self.shuffled)
+            for cluster in clusters:
+                logger.debug(f"Composing the trace for scenarios {cluster}")
+                tracestate.extend(self._compose_trace(cluster))
+        else:
+            tracestate = self._compose_trace(self.shuffled)
+
+        if tracestate.data_coverage:
+            self._extend_for_data_coverage(tracestate)
+
+        self._deliver_trace(tracestate, chunk_size, shards, shard)
+
+    def _compose_trace(self, indexes: list[int]) -> TraceState:
         # a short trace without the need for repeating scenarios is preferred
-        tracestate = self._try_to_reach_full_coverage(allow_duplicate_scenarios=False)
+        tracestate = self._try_to_reach_full_coverage(allow_duplicate_scenarios=False, indexes=indexes)
 
         if not tracestate.coverage_reached():
             logger.debug("Direct trace not available. Allowing repetition of scenarios")
+            tracestate = self._try_to_reach_full_coverage(allow_duplicate_scenarios=True, indexes=indexes)
+            if not tracestate.coverage_reached():
+                raise Exception("Unable to compose a consistent suite")
+        return tracestate
+
+    def _independent_clusters(self) -> list[list[int]]:
+        """
+        Splits the scenarios into clusters that use different model data. These clusters do not
+        influence each other, so their traces can be searched for separately and concatenated. With
+        visualisation or data coverage, the complete search is needed, and the scenarios are kept
+        in a single cluster. Clusters and their scenarios are in the order of the shuffle.
+        """
+        if self.visualiser is not None or self.data_coverage_strength:
+            return [self.shuffled]
+        position = {index: n for n, index in enumerate(self.shuffled)}
+        return sorted([sorted(cluster, key=position.get) for cluster in self.dependencies.clusters],
+                      key=lambda cluster: position[cluster[0]])
+
+    def _explore_test_suite(self, seed: str | int | bytes | bytearray, graph: str, suite_name: str, export_dir: str,
+                            max_depth: int, max_states: int, chunk_size: int = 0, shards: int = 1, shard: int = 1):
+        """
+        Explores the reachable model states first, and composes the trace from the resulting state
+        graph. If the exploration was limited and the graph does not cover all scenarios, the trace
+        is searched for as in offline mode.
+        """
+        self._prepare_test_suite(seed, graph, suite_name, export_dir)
+        self._fail_on_unreachable_scenarios()
+        self.state_graph = StateGraph([self._scenario(index) for index in self.shuffled], max_depth, max_states,
+                                      self.max_refinement_depth)
+        self.state_graph.log_summary()
+        unreached = set(self.shuffled) - self.state_graph.covered
+        if unreached and self.state_graph.exact:
+            raise Exception("Unable to compose a consistent suite. These scenarios are not reachable from "
+                            "the initial model state:\n\t" + "\n\t".join(
+                                [f"{index}: {self._scenario(index).name}" for index in sorted(unreached)]))
+
+        path = self.state_graph.walk(set(self.shuffled))
+        if path is None:
+            logger.info("Explored states do not cover all scenarios. Searching for a trace instead.")
             tracestate = self._try_to_reach_full_coverage(allow_duplicate_scenarios=True)
             if not tracestate.coverage_reached():
                 raise Exception("Unable to compose a consistent suite")
+        else:
+            tracestate = TraceState(self.shuffled)
+            StateGraph.replay(path, tracestate)
+            self.__update_visualisation(tracestate)
+        self._deliver_trace(tracestate, chunk_size, shards, shard)
 
-        self.out_suite.scenarios = tracestate.get_trace()
+    def _deliver_trace(self, tracestate: TraceState, chunk_size: int, shards: int, shard: int):
+        if chunk_size:
+            self._split_into_parts(tracestate, chunk_size)
+        elif shards > 1:
+            self.out_suite.scenarios = self._select_shard(tracestate, shards, shard)
+        else:
+            self.out_suite.scenarios = tracestate.get_trace()
         self._report_tracestate_wrapup(tracestate)
 
-    def _try_to_reach_full_coverage(self, allow_duplicate_scenarios: bool) -> TraceState:
-        tracestate = TraceState(self.shuffled)
+    def _extend_for_data_coverage(self, tracestate: TraceState):
+        """
+        Continues the trace, that already covers all scenarios, with repeated scenarios until
+        all t-wise data combinations are covered. This is best effort. If a combination cannot be
+        reached, the trace ends at the last point where new data coverage was reached.
+        """
+        tracestate.commit()
+        tracestate.require_data_coverage()
+        for _ in self._search_trace(tracestate, allow_duplicate_scenarios=True):
+            tracestate.commit()
+        while tracestate.can_rewind():
+            tracestate.rewind()
+        covered, total = tracestate.data_coverage.status
+        logger.info(f"Data coverage ({self.data_coverage_strength}-wise): {covered} of {total} combinations covered")
+
+    def _split_into_parts(self, tracestate: TraceState, chunk_size: int):
+        """
+        Places the trace in numbered sub-suites of about chunk_size scenarios each, instead
+        of directly in the output suite. Refinements are never split over multiple parts.
+        """
+        chunks = tracestate.get_trace_chunks(chunk_size)
+        width = len(str(len(chunks)))
+        for n, chunk in enumerate(chunks, start=1):
+            part = Suite(f"Part {n:0{width}}", parent=self.out_suite)
+            part.scenarios = chunk
+            self.out_suite.suites.append(part)
+
+    @staticmethod
+    def _select_shard(tracestate: TraceState, shards: int, shard: int) -> list[Scenario]:
+        """
+        Divides the trace into segments that each start from an empty model and distributes
+        these over the shards, longest segments first, to balance the number of scenarios per
+        shard. Returns the scenarios for the selected shard, in their original trace order.
+        """
+        segments = tracestate.get_independent_segments()
+        sizes = [0] * shards
+        assigned: list[list[int]] = [[] for _ in range(shards)]
+        for index in sorted(range(len(segments)), key=lambda i: len(segments[i]), reverse=True):
+            target = sizes.index(min(sizes))
+            sizes[target] += len(segments[index])
+            assigned[target].append(index)
+        if len(segments) < shards:
+            logger.warn(f"The trace has only {len(segments)} independent segment(s) for {shards} shards. "
+                        "Add scenarios that return the model to its initial state to allow more shards.")
+        logger.info(f"Running shard {shard} of {shards}: {sizes[shard-1]} of "
+                    f"{sum(sizes)} scenarios from {len(assigned[shard-1])} independent segment(s)")
+        return [scenario for index in sorted(assigned[shard-1]) for scenario in segments[index]]
+
+    def _online_trace(self) -> Iterator[list[Scenario]]:
+        """
+        Generates the trace in batches. Each time new coverage is reached, the trace so far
+        is committed and yielded, so that it can be executed while the search continues.
+        Committed scenarios are never rolled back.
+        """
+        self._fail_on_unreachable_scenarios()
+        tracestate = TraceState(self.shuffled, max_refinement_depth=self.max_refinement_depth)
+        for _ in self._search_trace(tracestate, allow_duplicate_scenarios=False):
+            yield tracestate.commit()
+
+        if not tracestate.coverage_reached():
+            logger.debug("Direct trace not available. Allowing repetition of scenarios")
+            for _ in self._search_trace(tracestate, allow_duplicate_scenarios=True):
+                yield tracestate.commit()
+            if not tracestate.coverage_reached():
+                raise Exception("Unable to compose a consistent suite")
+
+        remainder = tracestate.commit()
+        if remainder:
+            yield remainder
+        self._report_tracestate_wrapup(tracestate)
+        self.__write_visualisation()
+
+    def _soak_trace(self, max_steps: int, max_duration: float) -> Iterator[list[Scenario]]:
+        """
+        Walks through the model at random, without aiming for coverage, until max_steps scenarios
+        are generated or max_duration seconds have passed. A value of 0 means no limit. Limits
+        are checked between scenarios, so a refinement in progress is always completed. Only the
+        last SOAK_WINDOW scenarios are kept for rewinding, older scenarios are yielded for
+        execution and released.
+        """
+        if self.visualiser is not None:
+            logger.warn("Visualisation is not available in soak mode")
+            self.visualiser = None
+        deadline = time.monotonic() + max_duration if max_duration else None
+        n_steps = 0
+        tracestate = TraceState(self.shuffled, max_refinement_depth=self.max_refinement_depth)
+        while True:
+            limit_reached = ((max_steps and n_steps + tracestate.uncommitted >= max_steps)
+                             or (deadline and time.monotonic() >= deadline))
+            if limit_reached and not tracestate.is_refinement_active():
+                break
+            options = [i for i in self.shuffled if i not in tracestate.tried and i not in tracestate.sleeping
+                       and not tracestate.is_refinement_active(i)]
+            if not options:
+                if not tracestate.can_rewind():
+                    raise Exception("Soak run stopped. No scenario fits the model's current state.")
+                tail = modeller.rewind(tracestate)
+                logger.debug(f"Having to roll back up to {tail.scenario.name if tail else 'the beginning'}")
+                continue
+            candidate_id = random.choice(options)
+            candidate = self._select_scenario_variant(candidate_id, tracestate)
+            if not candidate:
+                tracestate.reject_scenario(candidate_id)
+                self._reject_equivalents(candidate_id, tracestate)
+                continue
+            previous_len = len(tracestate)
+            modeller.try_to_fit_in_scenario(candidate, tracestate, self.dependencies.exit_unchanged)
+            if len(tracestate) == previous_len:
+                self._reject_equivalents(candidate_id, tracestate)
+            else:
+                self._restrict_to_refiners(tracestate)
+            if len(tracestate) > previous_len and not tracestate.is_refinement_active():
+                batch = tracestate.commit(keep=self.SOAK_WINDOW)
+                if batch:
+                    n_steps += len(batch)
+                    tracestate.discard_committed()
+                    yield batch
+
+        remainder = tracestate.commit()
+        if remainder:
+            yield remainder
+        logger.info(f"Soak run completed after {n_steps + len(remainder)} scenarios")
+
+    def _try_to_reach_full_coverage(self, allow_duplicate_scenarios: bool,
+                                    indexes: list[int] | None = None) -> TraceState:
+        data_coverage = DataCoverage(self.data_coverage_strength) if self.data_coverage_strength else None
+        tracestate = TraceState(self.shuffled if indexes is None else indexes, data_coverage,
+                                self.max_refinement_depth)
+        for _ in self._search_trace(tracestate, allow_duplicate_scenarios):
+            pass
+        return tracestate
+
+    def _search_trace(self, tracestate: TraceState, allow_duplicate_scenarios: bool) -> Iterator[None]:
+        """
+        Extends the trace in tracestate until coverage is reached or no more options remain.
+        Yields each time the trace reaches new coverage while no refinement is active. These
+        are the points where the trace so far can safely be committed.
+        """
         while not tracestate.coverage_reached():
             candidate_id = tracestate.next_candidate(retry=allow_duplicate_scenarios)
             self.__update_visualisation(tracestate)
@@ -162,10 +438,23 @@ class SuiteProcessors:
                 candidate = self._select_scenario_variant(candidate_id, tracestate)
                 if not candidate:  # No valid variant available in the current state
                     tracestate.reject_scenario(candidate_id)
+                    self._reject_equivalents(candidate_id, tracestate)
                     self.__update_visualisation(tracestate)
                     continue
                 previous_len = len(tracestate)
-                modeller.try_to_fit_in_scenario(candidate, tracestate)
+                # Partial-order reduction (sleep sets): scenarios tried before this candidate, that commute
+                # with it, need not be tried after it. That ordering leads to states that were tried already.
+                explored = set(tracestate.tried) | tracestate.sleeping
+                refining = tracestate.is_refinement_active()
+                modeller.try_to_fit_in_scenario(candidate, tracestate, self.dependencies.exit_unchanged)
+                if len(tracestate) == previous_len:  # Rejected, or inserted and rolled back again
+                    self._reject_equivalents(candidate_id, tracestate)
+                elif tracestate[-1].remainder:
+                    self._restrict_to_refiners(tracestate)
+                elif (explored and not refining and tracestate[-1].id == str(candidate_id)
+                      and not tracestate.data_coverage):
+                    tracestate.put_to_sleep({index for index in explored
+                                             if self.dependencies.commute(index, candidate_id)})
                 self.__update_visualisation(tracestate)
                 self._report_tracestate_to_user(tracestate)
                 if len(tracestate) > previous_len:
@@ -182,7 +471,8 @@ class SuiteProcessors:
                         self.__update_visualisation(tracestate)
                         self._report_tracestate_to_user(tracestate)
                         logger.debug(f"last state:\n{tracestate.model.get_status_text()}")
-        return tracestate
+                    elif tracestate.coverage_drought == 0 and not tracestate.is_refinement_active():
+                        yield
 
     def __update_visualisation(self, tracestate: TraceState):
         if self.visualiser is not None:
@@ -203,27 +493,48 @@ class SuiteProcessors:
     def __last_candidate_changed_nothing(tracestate: TraceState) -> bool:
         if len(tracestate) < 2:
             return False
-        if tracestate[-1].id != tracestate[-2].id:
+        if tracestate[-1].id != tracestate[-2].id or tracestate.coverage_drought == 0:
             return False
         return tracestate[-1].model == tracestate[-2].model
 
     def _select_scenario_variant(self, candidate_id: int, tracestate: TraceState) -> Scenario:
         candidate = self._scenario_with_repeat_counter(candidate_id, tracestate)
-        candidate = modeller.generate_scenario_variant(candidate, tracestate.model or ModelSpace())
+        candidate = modeller.generate_scenario_variant(candidate, tracestate.model or ModelSpace(),
+                                                       tracestate.data_coverage)
         return candidate
 
+    def _reject_equivalents(self, candidate_id: int, tracestate: TraceState):
+        """A scenario that does not fit, means that its equivalent scenarios do not fit either"""
+        for index in self.dependencies.equivalents.get(candidate_id, []):
+            if index in tracestate.c_pool and index not in tracestate.tried:
+                tracestate.reject_scenario(index)
+
+    def _restrict_to_refiners(self, tracestate: TraceState):
+        """
+        When the trace ends in a partial scenario, the next scenario must refine it. Scenarios that
+        cannot contribute to the refinement's exit conditions are excluded from candidacy.
+        """
+        if not tracestate or not tracestate[-1].remainder:
+            return
+        refiners = self.dependencies.refiners(tracestate[-1].remainder.steps[1])
+        if refiners is not None:
+            tracestate.put_to_sleep(set(tracestate.c_pool) - refiners)
+
     def _scenario_with_repeat_counter(self, index: int, tracestate: TraceState) -> Scenario:
         """
         Fetches the scenario by index and, if this scenario is already
         used in the trace, adds a repetition counter to its name.
         """
-        candidate = next(s for s in self.scenarios if s.src_id == index)
+        candidate = self._scenario(index)
         rep_count = tracestate.count(index)
         if rep_count:
-            candidate = candidate.copy()
+            candidate = candidate.derive()
             candidate.name = f"{candidate.name} (rep {rep_count+1})"
         return candidate
 
+    def _scenario(self, index: int) -> Scenario:
+        return next(s for s in self.scenarios if s.src_id == index)
+
     @staticmethod
     def _fail_on_step_errors(suite: Suite):
         error_list = suite.steps_with_errors()
@@ -234,6 +545,11 @@ class SuiteProcessors:
                                   for s in error_list])
             raise Exception(err_msg)
 
+    def _fail_on_unreachable_scenarios(self):
+        if self.dependencies.unreachable:
+            raise Exception("Unable to compose a consistent suite. These scenarios need model data that "
+                            "no scenario provides:\n\t" + "\n\t".join(self.dependencies.unreachable.values()))
+
     @staticmethod
     def _report_tracestate_to_user(tracestate: TraceState):
         user_trace = f"[{', '.join(tracestate.id_trace)}]"
@@ -30,20 +30,29 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
 import robot.model
 import robot.running.model as rmodel
 from .suitedata import Suite, Scenario, Step
 from .suiteprocessors import SuiteProcessors
 from robot.api import logger
 from robot.api.deco import library, keyword
-from typing import Any
+from robot.running.keywordimplementation import KeywordImplementation
+from robot.utils import is_truthy, normalize
+from robot.variables import contains_variable
+from typing import Any, Iterator
 from robot.libraries.BuiltIn import BuiltIn
 Robot = BuiltIn()
 
+TREAT_MODEL_BASED = "Treat this test suite Model-based"
+
 
 @library(scope="GLOBAL", listener='SELF')
 class SuiteReplacer:
-    def __init__(self, processor: str = 'process_test_suite', processor_lib: str | None = None):
+    def __init__(self, processor: str = 'process_test_suite', processor_lib: str | None = None,
+                 pregenerate: bool = False):
         self.current_suite: robot.model.TestSuite | None = None
         self.robot_suite: robot.model.TestSuite | None = None
         self.processor_lib_name: str | None = processor_lib
@@ -51,6 +60,12 @@ class SuiteReplacer:
         self._processor_lib: SuiteProcessors | None | object = None
         self._processor_method: Any = None
         self.processor_options: dict[str, Any] = {}
+        self.scenario_feed: Iterator[list[Scenario]] | None = None
+        # Pre-generation of traces for upcoming suites, only for the default processor
+        self.pregenerate: bool = pregenerate and processor_lib is None
+        self._pool: ProcessPoolExecutor | None = None
+        # {robot suite id: (model fingerprint, options, future)}
+        self.background_traces: dict[str, tuple[tuple, dict[str, Any], Future]] = {}
 
     @property
     def processor_lib(self) -> SuiteProcessors:
@@ -68,7 +83,7 @@ class SuiteReplacer:
             self._processor_method = getattr(self._processor_lib, self.processor_name)
         return self._processor_method
 
-    @keyword(name="Treat this test suite Model-based")
+    @keyword(name=TREAT_MODEL_BASED)
     def treat_model_based(self, **kwargs):
         """
         Add this keyword to a suite setup to treat that test suite model-based.
@@ -82,6 +97,9 @@ class SuiteReplacer:
         processor. If an option was already set on library level (See: `Set model-based options` and
         `Update model-based options`, then these arguments take precedence over the library option and
         affect only the current test suite.
+
+        With option `mode=online`, execution starts as soon as the first scenarios are known.
+        The remaining trace is generated while the test suite is running.
         """
         self.robot_suite = self.current_suite
 
@@ -89,9 +107,12 @@ class SuiteReplacer:
         local_settings = self.processor_options.copy()
         local_settings.update(kwargs)
         master_suite = self.__process_robot_suite(self.robot_suite, parent=None)
-        modelbased_suite = self.processor_method(master_suite, **local_settings)
+        modelbased_suite = self.__collect_background_trace(master_suite, local_settings)
+        if modelbased_suite is None:
+            modelbased_suite = self.processor_method(master_suite, **local_settings)
         self.__clearTestSuite(self.robot_suite)
         self.__generateRobotSuite(modelbased_suite, self.robot_suite)
+        self.scenario_feed = modelbased_suite.scenario_feed
 
     @keyword("Set model-based options")
     def set_model_based_options(self, **kwargs):
@@ -109,32 +130,33 @@ class SuiteReplacer:
         """
         self.processor_options.update(kwargs)
 
-    def __process_robot_suite(self, in_suite: robot.model.TestSuite, parent: Suite | None) -> Suite:
+    def __process_robot_suite(self, in_suite: robot.model.TestSuite, parent: Suite | None,
+                              local_keywords: list[KeywordImplementation] | None = None) -> Suite:
         out_suite = Suite(in_suite.name, parent)
         out_suite.filename = in_suite.source
 
         if in_suite.setup and parent is not None:
             step_info = Step(in_suite.setup.name, *in_suite.setup.args, parent=out_suite)
-            step_info.add_robot_dependent_data(Robot._namespace.get_runner(step_info.org_step).keyword)
+            step_info.add_robot_dependent_data(self.__find_keyword(step_info, local_keywords))
             out_suite.setup = step_info
 
         if in_suite.teardown and parent is not None:
             step_info = Step(in_suite.teardown.name, *in_suite.teardown.args, parent=out_suite)
-            step_info.add_robot_dependent_data(Robot._namespace.get_runner(step_info.org_step).keyword)
+            step_info.add_robot_dependent_data(self.__find_keyword(step_info, local_keywords))
             out_suite.teardown = step_info
 
         for st in in_suite.suites:
-            out_suite.suites.append(self.__process_robot_suite(st, parent=out_suite))
+            out_suite.suites.append(self.__process_robot_suite(st, parent=out_suite, local_keywords=local_keywords))
         for tc in in_suite.tests:
             scenario = Scenario(tc.name, parent=out_suite)
             if tc.setup:
                 step_info = Step(tc.setup.name, *tc.setup.args, parent=scenario)
-                step_info.add_robot_dependent_data(Robot._namespace.get_runner(step_info.org_step).keyword)
+                step_info.add_robot_dependent_data(self.__find_keyword(step_info, local_keywords))
                 scenario.setup = step_info
 
             if tc.teardown:
                 step_info = Step(tc.teardown.name, *tc.teardown.args, parent=scenario)
-                step_info.add_robot_dependent_data(Robot._namespace.get_runner(step_info.org_step).keyword)
+                step_info.add_robot_dependent_data(self.__find_keyword(step_info, local_keywords))
                 scenario.teardown = step_info
             last_gwt = None
 
@@ -142,7 +164,7 @@ class SuiteReplacer:
                 if isinstance(step_def, rmodel.Keyword):
                     step_info = Step(step_def.name, *step_def.args, parent=scenario, assign=step_def.assign,
                                      prev_gherkin_kw=last_gwt)
-                    step_info.add_robot_dependent_data(Robot._namespace.get_runner(step_info.org_step).keyword)
+                    step_info.add_robot_dependent_data(self.__find_keyword(step_info, local_keywords))
                     scenario.steps.append(step_info)
 
                     if step_info.gherkin_kw:
@@ -159,6 +181,98 @@ class SuiteReplacer:
 
         return out_suite
 
+    @staticmethod
+    def __find_keyword(step: Step, local_keywords: list[KeywordImplementation] | None) -> KeywordImplementation:
+        """
+        Returns Robot's keyword object for the step. For suites that are not running yet, the
+        keywords defined in the suite file itself (local_keywords) are not part of the running
+        namespace. These take precedence, like they do when the suite is running.
+        """
+        if local_keywords:
+            matches = [kw for kw in local_keywords if kw.matches(step.kw_wo_gherkin)]
+            if len(matches) > 1:
+                # Same preference as Robot: exact names first, then the most specific embedded match
+                matches = ([kw for kw in matches if not kw.embedded]
+                           or [kw for kw in matches if not any(kw.matches(other.name) and not other.matches(kw.name)
+                                                               for other in matches)])
+            if len(matches) == 1:
+                return matches[0]
+        return Robot._namespace.get_runner(step.org_step).keyword
+
+    def __start_background_generation(self, suite: robot.model.TestSuite):
+        """
+        Starts trace generation in a background process for all upcoming suites that use
+        the model-based keyword directly as their suite setup. Their keywords are resolved
+        from their own suite file and the namespace of the current suite. When the suite is reached, the background
+        result is only used if the suite's model and options turn out to be identical.
+        """
+        root = suite
+        while root.parent:
+            root = root.parent
+        execution_order = list(self.__suites_in_execution_order(root))
+        current_index = next(i for i, s in enumerate(execution_order) if s is suite)
+        for upcoming in execution_order[current_index+1:]:
+            if not self.__is_model_based(upcoming):
+                continue
+            options = self.processor_options.copy()
+            options.update(arg.split('=', 1) for arg in upcoming.setup.args)
+            if set(options) & {'mode', 'graph', 'export_graph_data', 'import_graph_data'}:
+                continue
+            if upcoming.id in self.background_traces:
+                if self.background_traces[upcoming.id][1] == options:
+                    continue
+                self.background_traces.pop(upcoming.id)[2].cancel()  # Options changed since submission
+            model = self.__process_robot_suite(upcoming, parent=None, local_keywords=list(upcoming.resource.keywords))
+            if model.has_error():
+                continue  # Not all keywords could be resolved before the suite is running
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+            future = self._pool.submit(_generate_in_background, self.processor_name, model, options)
+            self.background_traces[upcoming.id] = (_model_fingerprint(model), options, future)
+            logger.debug(f"Started background trace generation for suite '{upcoming.name}'")
+
+    @staticmethod
+    def __suites_in_execution_order(suite: robot.model.TestSuite) -> Iterator[robot.model.TestSuite]:
+        yield suite
+        for subsuite in suite.suites:
+            yield from SuiteReplacer.__suites_in_execution_order(subsuite)
+
+    @staticmethod
+    def __is_model_based(suite: robot.model.TestSuite) -> bool:
+        """
+        True for suites that import the library with pregeneration enabled and that have
+        the model-based keyword as suite setup with static named arguments.
+        """
+        return (suite.has_setup
+                and any(imp.type == 'LIBRARY' and any(normalize(arg.split('=', 1)[0]) == 'pregenerate'
+                                                      and is_truthy(arg.split('=', 1)[1]) for arg in imp.args)
+                        for imp in suite.resource.imports)
+                and normalize(suite.setup.name.rsplit('.', 1)[-1]) == normalize(TREAT_MODEL_BASED)
+                and all('=' in arg and not contains_variable(arg) for arg in suite.setup.args))
+
+    def __collect_background_trace(self, model: Suite, options: dict[str, Any]) -> Suite | None:
+        if self.robot_suite.id not in self.background_traces:
+            return None
+        fingerprint, bg_options, future = self.background_traces.pop(self.robot_suite.id)
+        if fingerprint != _model_fingerprint(model) or bg_options != options:
+            future.cancel()
+            logger.debug("Background trace does not match the current suite. Generating a new trace.")
+            return None
+        try:
+            modelbased_suite, seed = future.result()
+        except Exception as err:
+            if str(err).startswith("Unable to compose"):
+                raise  # The model itself has no solution, generating again would not help
+            # Any other failure in the worker or in transferring data, e.g. unpicklable argument values
+            logger.debug(f"Background trace generation failed. Generating a new trace.\n{err!r}")
+            return None
+        if str(seed).lower() == 'none':
+            logger.info("Using trace that was generated in the background using the system's random seed.")
+        else:
+            logger.info(f"Using trace that was generated in the background, seed={seed} (use seed to rerun this trace)")
+        logger.info("Trace composed:\n" + "\n".join(tc.name for tc in modelbased_suite.scenarios))
+        return modelbased_suite
+
     def __clearTestSuite(self, suite: robot.model.TestSuite):
         suite.tests.clear()
         suite.suites.clear()
@@ -177,24 +291,76 @@ class SuiteReplacer:
                                                     type='teardown')
             self.__generateRobotSuite(subsuite, new_suite)
         for tc in suite_model.scenarios:
-            new_tc = target_suite.tests.create(name=tc.name)
-            if tc.setup:
-                new_tc.setup = rmodel.Keyword(name=tc.setup.keyword,
-                                              args=tc.setup.posnom_args_str,
-                                              type='setup')
-            if tc.teardown:
-                new_tc.teardown = rmodel.Keyword(name=tc.teardown.keyword,
-                                                 args=tc.teardown.posnom_args_str,
-                                                 type='teardown')
-            for step in tc.steps:
-                if step.keyword == 'VAR':
-                    new_tc.body.create_var(step.posnom_args_str[0], step.posnom_args_str[1:])
-                else:
-                    new_tc.body.create_keyword(name=step.keyword, assign=step.assign, args=step.posnom_args_str)
+            self.__generateRobotTest(tc, target_suite)
+
+    def __generateRobotTest(self, tc: Scenario, target_suite: robot.model.TestSuite):
+        new_tc = target_suite.tests.create(name=tc.name)
+        if tc.setup:
+            new_tc.setup = rmodel.Keyword(name=tc.setup.keyword,
+                                          args=tc.setup.posnom_args_str,
+                                          type='setup')
+        if tc.teardown:
+            new_tc.teardown = rmodel.Keyword(name=tc.teardown.keyword,
+                                             args=tc.teardown.posnom_args_str,
+                                             type='teardown')
+        for step in tc.steps:
+            if step.keyword == 'VAR':
+                new_tc.body.create_var(step.posnom_args_str[0], step.posnom_args_str[1:])
+            else:
+                new_tc.body.create_keyword(name=step.keyword, assign=step.assign, args=step.posnom_args_str)
+
+    def __feed_next_scenarios(self):
+        try:
+            scenarios = next(self.scenario_feed, None)
+        except Exception as err:
+            self.scenario_feed = None
+            # Tests are already running, report the failure as part of the suite
+            failed_tc = self.robot_suite.tests.create(name="Model-based trace generation")
+            failed_tc.body.create_keyword(name='Fail', args=[str(err)])
+            return
+        if scenarios is None:
+            self.scenario_feed = None
+            return
+        for tc in scenarios:
+            self.__generateRobotTest(tc, self.robot_suite)
 
     def _start_suite(self, suite: Suite | None, result):
         self.current_suite = suite
+        if self.pregenerate:
+            self.__start_background_generation(suite)
+
+    def _end_test(self, test: robot.model.TestCase, result):
+        if self.scenario_feed and test.parent is self.robot_suite and test is self.robot_suite.tests[-1]:
+            self.__feed_next_scenarios()
 
     def _end_suite(self, suite: Suite | None, result):
         if suite == self.robot_suite:
             self.robot_suite = None
+            self.scenario_feed = None
+        if suite.parent is None and self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def _generate_in_background(processor_name: str, model: Suite, options: dict[str, Any]) -> tuple[Suite, str]:
+    """Runs in a separate process. Returns the model-based suite and the seed that was used."""
+    options = options.copy()
+    if str(options.get('seed', 'new')).strip().lower() == 'new':
+        # The worker's log is not part of Robot's log. Resolve the seed here, so it can be reported.
+        options['seed'] = SuiteProcessors._generate_seed()
+    modelbased_suite = getattr(SuiteProcessors(), processor_name)(model, **options)
+    return modelbased_suite, str(options['seed']).strip()
+
+
+def _model_fingerprint(suite: Suite) -> tuple:
+    """Captures all information from the suite model that can affect trace generation"""
+    def step_print(step: Step | None) -> tuple | None:
+        if step is None:
+            return None
+        return (step.org_step, step.org_pn_args, step.assign, step.signature, repr(step.model_info),
+                tuple((arg.name, repr(arg.value), arg.kind, arg.is_default) for arg in step.args))
+
+    return (suite.name, step_print(suite.setup), step_print(suite.teardown),
+            tuple(_model_fingerprint(subsuite) for subsuite in suite.suites),
+            tuple((sc.name, step_print(sc.setup), step_print(sc.teardown), tuple(map(step_print, sc.steps)))
+                  for sc in suite.scenarios))
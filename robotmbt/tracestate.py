@@ -30,6 +30,10 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import bisect
+from typing import Iterator
+
+from robotmbt.datacoverage import DataCoverage
 from robotmbt.modelspace import ModelSpace
 from robotmbt.suitedata import Scenario
 
@@ -42,6 +46,8 @@ class TraceSnapShot:
         self.remainder: Scenario | None = remainder
         self._model: ModelSpace = model_state.copy()
         self.coverage_drought: int = drought
+        self.data: tuple[frozenset, frozenset] | None = None  # data coverage targets and covered combinations
+        self.refining: tuple[int, ...] = ()  # Open refinements after pushing a partial scenario
 
     @property
     def model(self) -> ModelSpace:
@@ -49,13 +55,18 @@ class TraceSnapShot:
 
 
 class TraceState:
-    def __init__(self, scenario_indexes: list[int]):
+    def __init__(self, scenario_indexes: list[int], data_coverage: DataCoverage | None = None,
+                 max_refinement_depth: int = 0):
         self.c_pool: dict[int, int] = {index: 0 for index in scenario_indexes}
         if len(self.c_pool) != len(scenario_indexes):
             raise ValueError("Scenarios must be uniquely identifiable")
         self._tried: list[list[int]] = [[]]  # Keeps track of the scenarios already tried at each step in the trace
+        self._sleeping: list[frozenset[int]] = [frozenset()]  # Scenarios to skip at each step, see put_to_sleep()
         self._snapshots: list[TraceSnapShot] = []  # Keeps details for elements in trace
         self._open_refinements: list[int] = []
+        self._committed: int = 0  # Number of leading snapshots that can no longer be rewound
+        self.data_coverage: DataCoverage | None = data_coverage
+        self.max_refinement_depth: int = max_refinement_depth  # 0 for unlimited nesting of refinements
 
     @property
     def model(self) -> ModelSpace | None:
@@ -67,6 +78,11 @@ class TraceState:
         """returns the indices that were rejected or previously inserted at the current position"""
         return tuple(self._tried[-1])
 
+    @property
+    def sleeping(self) -> frozenset[int]:
+        """returns the indices that are skipped at the current position, without being tried"""
+        return self._sleeping[-1]
+
     @property
     def coverage_drought(self) -> int:
         """Number of scenarios since last new coverage"""
@@ -76,11 +92,18 @@ class TraceState:
     def id_trace(self):
         return [snap.id for snap in self._snapshots]
 
+    @property
+    def uncommitted(self) -> int:
+        """Number of scenarios at the end of the trace that are still eligible for rewinding"""
+        return len(self._snapshots) - self._committed
+
     @property
     def active_refinements(self):
         return self._open_refinements[:]
 
     def coverage_reached(self):
+        if self.data_coverage and self.data_coverage.required and not self.data_coverage.complete:
+            return False
         return all(self.c_pool.values())
 
     def get_trace(self) -> list[Scenario]:
@@ -88,13 +111,14 @@ class TraceState:
 
     def next_candidate(self, retry: bool = False):
         for i in self.c_pool:
-            if i not in self._tried[-1] and not self.is_refinement_active(i) and self.count(i) == 0:
+            if (i not in self._tried[-1] and i not in self._sleeping[-1] and not self.is_refinement_active(i)
+                    and self.count(i) == 0):
                 return i
 
         if not retry:
             return None
         for i in self.c_pool:
-            if i not in self._tried[-1] and not self.is_refinement_active(i):
+            if i not in self._tried[-1] and i not in self._sleeping[-1] and not self.is_refinement_active(i):
                 return i
 
         return None
@@ -141,8 +165,32 @@ class TraceState:
         """Trying a scenario excludes it from further cadidacy on this level"""
         self._tried[-1].append(i_scenario)
 
+    def put_to_sleep(self, indexes: set[int]):
+        """
+        Excludes scenarios from candidacy at the current position, without trying them. Used for
+        scenarios that were already tried before the last scenario in the trace, and that commute
+        with it. Their ordering after the last scenario leads to the states that were already tried.
+        """
+        self._sleeping[-1] = frozenset(indexes)
+
+    def require_data_coverage(self):
+        """
+        Makes data coverage needed for completion. Data coverage targets are only collected while
+        coverage is required, so the targets of the scenarios already in the trace are added now.
+        """
+        self.data_coverage.required = True
+        for snap in self._snapshots:
+            if snap.data is not None:
+                snap.data = self.data_coverage.tuples_for(int(snap.id.split('.')[0]), snap.scenario.data_choices)
+                self.data_coverage.add(snap.data[0], frozenset())
+
     def confirm_full_scenario(self, index: int, scenario: Scenario, model: ModelSpace):
-        c_drought = 0 if self.c_pool[index] == 0 else self.coverage_drought + 1
+        data = None
+        new_data = False
+        if self.data_coverage:
+            data = self.data_coverage.tuples_for(index, scenario.data_choices)
+            new_data = self.data_coverage.add(*data)
+        c_drought = 0 if self.c_pool[index] == 0 or new_data else self.coverage_drought + 1
         self.c_pool[index] += 1
         if self.is_refinement_active(index):
             id = f"{index}.0"
@@ -151,7 +199,34 @@ class TraceState:
             id = str(index)
             self._tried[-1].append(index)
             self._tried.append([])
+            self._sleeping.append(frozenset())
         self._snapshots.append(TraceSnapShot(id, scenario, model, drought=c_drought))
+        self._snapshots[-1].data = data
+
+    def refinement_allowed(self, index: int, model: ModelSpace, remainder: Scenario) -> bool:
+        """
+        Checks whether the scenario can be pushed as partial scenario. A new refinement is not allowed
+        when max_refinement_depth refinements are open already. Neither is a refinement that repeats an
+        earlier one in the trace, for the same remaining steps with the same open refinements and model
+        state, while no new coverage was reached in between. Such a branch only goes round in a cycle.
+        """
+        refining = (*self._open_refinements, *(() if self.is_refinement_active(index) else (index,)))
+        if self.max_refinement_depth and len(refining) > self.max_refinement_depth:
+            return False
+        if self.coverage_reached():
+            return True
+        steps = [step.keyword for step in remainder.steps[1:]]
+        fingerprint = None
+        for snap in reversed(self._snapshots):
+            if not snap.remainder:
+                if snap.coverage_drought == 0:
+                    break
+                continue
+            if snap.refining == refining and [step.keyword for step in snap.remainder.steps[1:]] == steps:
+                fingerprint = fingerprint or model.get_status_text()
+                if snap._model.get_status_text() == fingerprint:
+                    return False
+        return True
 
     def push_partial_scenario(self, index: int, scenario: Scenario, model: ModelSpace, remainder=None):
         if self.is_refinement_active(index):
@@ -161,15 +236,108 @@ class TraceState:
             self._tried[-1].append(index)
             self._open_refinements.append(index)
         self._tried.append([])
+        self._sleeping.append(frozenset())
         self._snapshots.append(TraceSnapShot(id, scenario, model, remainder, self.coverage_drought))
+        self._snapshots[-1].refining = tuple(self._open_refinements)
+
+    def extend(self, other: 'TraceState'):
+        """
+        Appends the trace of another TraceState, that covers scenarios using different model data.
+        The model data at the end of this trace is merged into each model of the appended trace.
+        """
+        base = self._snapshots[-1]._model if self._snapshots else None
+        for snap in other:
+            model = snap.model
+            if base is not None:
+                model.merge(base)
+            index = int(snap.id.split('.')[0])
+            if '.' in snap.id and not snap.id.endswith('.0'):
+                self.push_partial_scenario(index, snap.scenario, model, snap.remainder)
+            else:
+                self.confirm_full_scenario(index, snap.scenario, model)
+
+    def commit(self, keep: int = 0) -> list[Scenario]:
+        """
+        Marks the trace as final, except for the last `keep` snapshots. Committed scenarios are
+        excluded from rewinding. The commit never splits a refinement, so it can end earlier.
+        Returns the scenarios that were newly committed.
+        """
+        boundary = max(self._refinement_free_boundaries(self._committed, len(self._snapshots) - keep),
+                       default=self._committed)
+        newly_committed = [snap.scenario for snap in self._snapshots[self._committed:boundary]]
+        self._committed = boundary
+        return newly_committed
+
+    def get_trace_chunks(self, size: int) -> list[list[Scenario]]:
+        """
+        Splits the trace into consecutive parts of at most `size` scenarios. Parts only end
+        where no refinement is open, which makes a part longer than `size` if a refinement
+        does not fit in a part of its own.
+        """
+        boundaries = list(self._refinement_free_boundaries(0, len(self._snapshots)))
+        chunks = []
+        start = 0
+        while start < len(self._snapshots):
+            i = bisect.bisect_right(boundaries, start + size) - 1
+            if i >= 0 and boundaries[i] > start:
+                end = boundaries[i]
+            else:
+                end = boundaries[i+1] if i+1 < len(boundaries) else len(self._snapshots)
+            chunks.append([snap.scenario for snap in self._snapshots[start:end]])
+            start = end
+        return chunks
+
+    def get_independent_segments(self) -> list[list[Scenario]]:
+        """
+        Splits the trace at the points where the model is back in its initial, empty state.
+        Each segment starts from scratch, so it can run independently of the other segments.
+        """
+        segments = []
+        start = 0
+        for boundary in self._refinement_free_boundaries(0, len(self._snapshots)):
+            if not self._snapshots[boundary-1]._model.props or boundary == len(self._snapshots):
+                segments.append([snap.scenario for snap in self._snapshots[start:boundary]])
+                start = boundary
+        return segments
+
+    def _refinement_free_boundaries(self, start: int, end: int) -> Iterator[int]:
+        """
+        Yields, in increasing order, the positions between start and end where the trace can be
+        split without splitting a refinement. The trace is assumed to be split at start.
+        """
+        depth = 0
+        for pos in range(start, end):
+            if self._snapshots[pos].id.endswith('.1'):
+                depth += 1
+            elif self._snapshots[pos].id.endswith('.0'):
+                depth -= 1
+            if depth == 0:
+                yield pos + 1
+
+    def discard_committed(self):
+        """
+        Releases the committed part of the trace to keep memory use flat on long runs. The last
+        committed snapshot is kept as the starting point for the remainder of the trace.
+        Discarded scenarios are no longer included in get_trace(), but still count for coverage.
+        """
+        n_discard = self._committed - 1
+        if n_discard > 0:
+            # Completed refinements (.0) do not start a new level of tried scenarios
+            n_levels = sum(1 for snap in self._snapshots[:n_discard] if not snap.id.endswith('.0'))
+            del self._snapshots[:n_discard]
+            del self._tried[:n_levels]
+            del self._sleeping[:n_levels]
+            self._committed = 1
 
     def can_rewind(self) -> bool:
-        return len(self._snapshots) > 0
+        return len(self._snapshots) > self._committed
 
     def rewind(self) -> TraceSnapShot | None:
         id = self._snapshots[-1].id
         index = int(id.split('.')[0])
-        self._snapshots.pop()
+        snapshot = self._snapshots.pop()
+        if snapshot.data:
+            self.data_coverage.remove(*snapshot.data)
         if id.endswith('.0'):
             self.c_pool[index] -= 1
             self._open_refinements.append(index)
@@ -178,6 +346,7 @@ class TraceState:
             return self.rewind()
 
         self._tried.pop()
+        self._sleeping.pop()
         if '.' not in id:
             self.c_pool[index] -= 1
         if id.endswith('.1'):
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2026, J. Foederer
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+from robotmbt.datacoverage import DataCoverage, parse_data_coverage
+from robotmbt.substitutionmap import SubstitutionMap
+
+
+class TestParseDataCoverage(unittest.TestCase):
+    def test_data_coverage_is_off_by_default(self):
+        self.assertEqual(parse_data_coverage(''), 0)
+        self.assertEqual(parse_data_coverage('None'), 0)
+        self.assertEqual(parse_data_coverage(0), 0)
+
+    def test_pairwise_is_strength_2(self):
+        self.assertEqual(parse_data_coverage('pairwise'), 2)
+        self.assertEqual(parse_data_coverage('Pairwise'), 2)
+
+    def test_strength_can_be_set_explicitly(self):
+        self.assertEqual(parse_data_coverage('t=3'), 3)
+        self.assertEqual(parse_data_coverage('t = 1'), 1)
+
+    def test_invalid_values_are_rejected(self):
+        for option in ['triplewise', 't=', 't=0', 't=two', '3']:
+            with self.subTest(option=option):
+                self.assertRaises(ValueError, parse_data_coverage, option)
+
+
+class TestDataCoverage(unittest.TestCase):
+    @staticmethod
+    def solved(**options):
+        subs = SubstitutionMap()
+        for example_value, values in options.items():
+            subs.substitute(example_value, values)
+        subs.solve()
+        return subs
+
+    def test_targets_are_all_pairs_of_options(self):
+        dc = DataCoverage(2)
+        dc.required = True
+        targets, covered = dc.tuples_for(1, self.solved(A=[1, 2], B=[3, 4], C=[5]))
+        self.assertEqual(len(targets), 2*2 + 2*1 + 2*1)
+        self.assertEqual(len(covered), 3)
+        self.assertTrue(covered <= targets)
+
+    def test_strength_is_limited_by_number_of_example_values(self):
+        dc = DataCoverage(3)
+        dc.required = True
+        targets, covered = dc.tuples_for(1, self.solved(A=[1, 2], B=[3, 4]))
+        self.assertEqual(len(targets), 4)
+        self.assertEqual(len(covered), 1)
+
+    def test_combinations_without_a_unique_solution_are_no_target(self):
+        dc = DataCoverage(2)
+        dc.required = True
+        targets, _ = dc.tuples_for(1, self.solved(A=[1, 2], B=[1, 2], C=[2, 3]))
+        self.assertNotIn((1, (('A', 1), ('B', 1))), targets)
+        self.assertNotIn((1, (('A', 1), ('C', 2))), targets)
+        self.assertIn((1, (('A', 1), ('C', 3))), targets)
+
+    def test_targets_are_only_collected_when_required(self):
+        dc = DataCoverage(2)
+        targets, covered = dc.tuples_for(1, self.solved(A=[1, 2], B=[3, 4]))
+        self.assertEqual(targets, frozenset())
+        self.assertTrue(dc.add(targets, covered))
+        self.assertTrue(dc.complete)
+
+    def test_scenarios_without_example_values_have_no_targets(self):
+        dc = DataCoverage(2)
+        dc.required = True
+        self.assertEqual(dc.tuples_for(1, self.solved()), (frozenset(), frozenset()))
+
+    def test_targets_are_kept_per_scenario(self):
+        dc = DataCoverage(2)
+        dc.required = True
+        targets1, _ = dc.tuples_for(1, self.solved(A=[1, 2], B=[3, 4]))
+        targets2, _ = dc.tuples_for(2, self.solved(A=[1, 2], B=[3, 4]))
+        self.assertFalse(targets1 & targets2)
+
+    def test_adding_reports_new_coverage(self):
+        dc = DataCoverage(2)
+        dc.required = True
+        data = dc.tuples_for(1, self.solved(A=[1, 2], B=[3, 4]))
+        self.assertTrue(dc.add(*data))
+        self.assertEqual(dc.status, (1, 4))
+        self.assertFalse(dc.add(*data))
+        self.assertEqual(dc.status, (1, 4))
+        self.assertFalse(dc.complete)
+
+    def test_remove_reverts_add(self):
+        dc = DataCoverage(2)
+        dc.required = True
+        data = dc.tuples_for(1, self.solved(A=[1, 2], B=[3, 4]))
+        dc.add(*data)
+        dc.add(*data)
+        dc.remove(*data)
+        self.assertEqual(dc.status, (1, 4))
+        dc.remove(*data)
+        self.assertEqual(dc.status, (0, 0))
+        self.assertTrue(dc.complete)
+
+    def test_selected_solution_prefers_new_combinations(self):
+        dc = DataCoverage(1)
+        dc.required = True
+        subs = self.solved(A=[1, 2])
+        subs.solution = {'A': 1}
+        dc.add(*dc.tuples_for(1, subs))
+        dc.select_solution(1, subs)
+        self.assertEqual(subs.solution, {'A': 2})
+
+    def test_selected_solution_aims_for_combinations_that_random_solutions_miss(self):
+        dc = DataCoverage(2)
+        dc.required = True
+        subs = self.solved(A=[1, 2, 3], B=[4, 5, 6])
+        for a in [1, 2, 3]:
+            for b in [4, 5, 6]:
+                if (a, b) != (3, 6):
+                    subs.solution = {'A': a, 'B': b}
+                    dc.add(*dc.tuples_for(1, subs))
+        dc.select_solution(1, subs)
+        self.assertEqual(subs.solution, {'A': 3, 'B': 6})
+
+    def test_full_coverage_with_selected_solutions(self):
+        dc = DataCoverage(2)
+        dc.required = True
+        subs = self.solved(A=[1, 2, 3], B=[4, 5, 6], C=[7, 8])
+        for _ in range(50):
+            dc.select_solution(1, subs)
+            dc.add(*dc.tuples_for(1, subs))
+            if dc.complete:
+                break
+        self.assertTrue(dc.complete)
+        self.assertEqual(dc.status, (21, 21))
+
+    def test_each_selected_solution_covers_a_new_pair_until_complete(self):
+        dc = DataCoverage(2)
+        dc.required = True
+        subs = self.solved(A=[1, 2, 3], B=[4, 5, 6])
+        for _ in range(9):
+            dc.select_solution(1, subs)
+            self.assertTrue(dc.add(*dc.tuples_for(1, subs)))
+        self.assertTrue(dc.complete)
+
+    def test_selecting_a_solution_fails_without_a_solution(self):
+        dc = DataCoverage(2)
+        dc.required = True
+        subs = SubstitutionMap()
+        subs.substitute('A', [1])
+        subs.substitute('B', [1])
+        self.assertRaises(ValueError, dc.select_solution, 1, subs)
+
+
+if __name__ == '__main__':
+    unittest.main()
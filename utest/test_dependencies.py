@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2026, J. Foederer
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+from unittest.mock import patch
+
+from robotmbt import modeller
+from robotmbt.dependencies import DependencyAnalysis, ExpressionInfo, Footprint
+from robotmbt.steparguments import ArgKind, StepArgument, StepArguments
+from robotmbt.suitedata import Scenario, Step
+from robotmbt.tracestate import TraceState
+
+
+def scenario(src_id, *steps):
+    s = Scenario(f"scenario {src_id}")
+    s.src_id = src_id
+    for text, model_in, model_out in steps:
+        step = Step(text, parent=s)
+        step.model_info = dict(IN=model_in, OUT=model_out)
+        s.steps.append(step)
+    return s
+
+
+class TestExpressionInfo(unittest.TestCase):
+    def test_new_provides_a_domain_term(self):
+        info = ExpressionInfo('new card')
+        self.assertEqual(info.provides, [('card', None)])
+        self.assertEqual(info.needs, [])
+
+    def test_del_needs_the_domain_term(self):
+        self.assertEqual(ExpressionInfo('del card').needs, [('card', None)])
+
+    def test_bare_name_needs_the_domain_term(self):
+        self.assertEqual(ExpressionInfo('card').needs, [('card', None)])
+
+    def test_reading_an_attribute_needs_it(self):
+        info = ExpressionInfo("${name} in card.names")
+        self.assertEqual(info.needs, [('card', None), ('card', 'names')])
+        self.assertEqual(info.provides, [])
+
+    def test_assigning_an_attribute_provides_it(self):
+        info = ExpressionInfo('card.names = []')
+        self.assertEqual(info.needs, [('card', None)])
+        self.assertEqual(info.provides, [('card', 'names')])
+
+    def test_augmented_assignment_needs_the_attribute(self):
+        info = ExpressionInfo('card.count += 1')
+        self.assertIn(('card', 'count'), info.needs)
+        self.assertEqual(info.provides, [('card', 'count')])
+
+    def test_arguments_make_terms_unknown(self):
+        self.assertEqual(ExpressionInfo('new ${thing}').provides, [('*', None)])
+        self.assertEqual(ExpressionInfo('${thing}.done = True').provides, [('*', 'done')])
+        self.assertEqual(ExpressionInfo('${thing}.done').needs, [])
+
+    def test_scenario_scope_and_local_names_are_ignored(self):
+        self.assertEqual(ExpressionInfo('scenario.count == len([g.name for g in party.guests])').needs,
+                         [('party', None), ('party', 'guests')])
+
+    def test_reads_and_writes(self):
+        info = ExpressionInfo('card.sent = card.names != []')
+        self.assertEqual(info.reads, {('card', None), ('card', 'names')})
+        self.assertEqual(info.writes, {('card', 'sent')})
+        self.assertFalse(info.is_condition)
+
+    def test_method_calls_and_item_assignments_write_the_attribute(self):
+        self.assertEqual(ExpressionInfo('card.names.append(someone)').writes, {('card', 'names')})
+        self.assertEqual(ExpressionInfo('card.names[0] = someone').writes, {('card', 'names')})
+        self.assertEqual(ExpressionInfo('card.stamps[0].remove(x)').writes, {('card', 'stamps')})
+
+    def test_new_and_del_write_the_domain_term(self):
+        self.assertEqual(ExpressionInfo('new card').writes, {('card', None)})
+        self.assertEqual(ExpressionInfo('del card').writes, {('card', None)})
+
+    def test_scenario_scope_is_not_part_of_reads_and_writes(self):
+        info = ExpressionInfo('scenario.count = len(party.guests)')
+        self.assertEqual(info.reads, {('party', None), ('party', 'guests')})
+        self.assertEqual(info.writes, set())
+        self.assertTrue(ExpressionInfo('scenario.count == 2').is_condition)
+
+
+class TestFootprint(unittest.TestCase):
+    def test_scenarios_using_different_attributes_commute(self):
+        sign = Footprint(scenario(1, ('When someone signs', ['card.names == []'], ['card.names = [someone]'])))
+        stamp = Footprint(scenario(2, ('When the card is stamped', [], ['card.stamped = True'])))
+        self.assertTrue(sign.commutes_with(stamp))
+
+    def test_scenarios_that_write_what_the_other_reads_do_not_commute(self):
+        sign = Footprint(scenario(1, ('When someone signs', ['card.names == []'], ['card.names = [someone]'])))
+        send = Footprint(scenario(2, ('Given a signed card', ['card.names'], []),
+                                  ('When the card is sent', [], ['card.sent = True'])))
+        self.assertFalse(sign.commutes_with(send))
+        self.assertFalse(send.commutes_with(sign))
+
+    def test_deleting_a_domain_term_affects_all_of_its_attributes(self):
+        bin_card = Footprint(scenario(1, ('When the card is thrown away', ['card'], ['del card'])))
+        stamp = Footprint(scenario(2, ('When the card is stamped', [], ['card.stamped = True'])))
+        self.assertFalse(bin_card.commutes_with(stamp))
+
+    def test_scenarios_that_can_be_refined_never_commute(self):
+        party = Footprint(scenario(1, ('When the party happens', [], ['party.cake'])))
+        stamp = Footprint(scenario(2, ('When the card is stamped', [], ['card.stamped = True'])))
+        self.assertTrue(party.refinable)
+        self.assertFalse(party.commutes_with(stamp))
+
+    def test_arguments_are_filled_in_unless_modified(self):
+        sign = scenario(1, ('When ${name} signs', [], ['${name}.signed = True']))
+        sign.steps[0].args = StepArguments([StepArgument('${name}', 'card', ArgKind.EMBEDDED)])
+        self.assertEqual(Footprint(sign).writes, {('card', 'signed')})
+        sign.steps[0].model_info['MOD'] = ['${name}= [card, letter]']
+        sign.modifier_plan = None
+        self.assertEqual(Footprint(sign).writes, {('*', 'signed')})
+
+    def test_scenarios_do_not_commute_with_writes_to_the_options_of_their_modifiers(self):
+        replace = scenario(1, ('When the guests are replaced', [], ["party.guests = ['Alice']"]))
+        arrive = scenario(2, ('When ${name} arrives', ['party'], ['new arrival', 'arrival.who = ${name}']))
+        arrive.steps[0].args = StepArguments([StepArgument('${name}', 'Bob', ArgKind.EMBEDDED)])
+        self.assertTrue(DependencyAnalysis([replace, arrive]).commute(1, 2))
+        arrive.steps[0].model_info['MOD'] = ['${name}= party.guests']
+        arrive.modifier_plan = None
+        self.assertIn(('party', 'guests'), Footprint(arrive).reads)
+        self.assertFalse(DependencyAnalysis([replace, arrive]).commute(1, 2))
+
+
+class TestDependencyAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.buy = scenario(1, ('When a card is bought', [], ['new card', 'card.names = []']))
+        self.sign = scenario(2, ('Given there is a card', ['card'], []),
+                             ('When someone signs the card', ['card.names == []'], ['card.names.append(someone)']),
+                             ('Then the card is signed', [], ['someone in card.names']))
+        self.send = scenario(3, ('Given there is a signed card', ['card.names'], []),
+                             ('When the card is sent', [], ['card.sent = True']))
+        self.deliver = scenario(4, ('Given the card is sent', ['card.sent'], []),
+                                ('When the card is delivered', [], ['card.delivered = True']))
+
+    def test_depth_follows_dependencies(self):
+        deps = DependencyAnalysis([self.deliver, self.send, self.sign, self.buy])
+        self.assertEqual(deps.depth, {1: 0, 2: 1, 3: 1, 4: 2})
+        self.assertEqual(deps.unreachable, {})
+
+    def test_scenarios_depend_on_their_providers(self):
+        deps = DependencyAnalysis([self.buy, self.sign, self.send, self.deliver])
+        self.assertEqual(deps.depends_on, {1: set(), 2: {1}, 3: {1}, 4: {1, 3}})
+
+    def test_scenarios_needing_data_that_is_never_provided_are_unreachable(self):
+        deps = DependencyAnalysis([self.sign, self.send, self.deliver])
+        self.assertEqual(set(deps.unreachable), {2, 3, 4})
+        self.assertIn("no scenario provides card, needed in step 'Given there is a card'", deps.unreachable[2])
+
+    def test_scenario_can_provide_for_its_own_later_steps(self):
+        deps = DependencyAnalysis([self.buy, scenario(2, ('When a card is bought', [], ['new card']),
+                                                      ('When it is sent', [], ['card.sent = True']),
+                                                      ('Then it is sent', [], ['card.sent']))])
+        self.assertEqual(deps.depth, {1: 0, 2: 0})
+
+    def test_partial_scenarios_can_provide_for_their_refinement(self):
+        outer = scenario(1, ('Given nothing', ['new party'], []),
+                         ('When the party happens', [], ['party.cake']),
+                         ('Then there is cake', [], ['party.cake']))
+        refinement = scenario(2, ('Given a party', ['party'], []),
+                              ('When cake is baked', [], ['party.cake = True']))
+        deps = DependencyAnalysis([outer, refinement])
+        self.assertEqual(deps.unreachable, {})
+        self.assertEqual(deps.depth, {1: 2, 2: 1})
+
+    def test_scenarios_sharing_domain_terms_are_clustered(self):
+        light = scenario(5, ('When the light is installed', ['new light'], []))
+        deps = DependencyAnalysis([self.buy, light, self.sign, self.send])
+        self.assertEqual(deps.clusters, [[1, 2, 3], [5]])
+
+    def test_scenario_scope_links_refinements(self):
+        outer = scenario(1, ('When the party happens', ['scenario.level = 1'], ['scenario.level == 2']))
+        inner = scenario(2, ('When the cake is baked', ['scenario.level == 1'], ['scenario.level = 2']))
+        other = scenario(3, ('When the light is installed', ['new light'], []))
+        self.assertEqual(DependencyAnalysis([outer, other, inner]).clusters, [[1, 2], [3]])
+
+    def test_domain_terms_from_arguments_keep_a_single_cluster(self):
+        light = scenario(5, ('When ${thing} is installed', ['new ${thing}'], []))
+        self.assertEqual(DependencyAnalysis([self.buy, light]).clusters, [[1, 5]])
+
+    def test_names_used_by_modifiers_are_clustered(self):
+        invite = scenario(5, ('When guests are invited', ['new party', "party.guests = ['Alice']"], []))
+        arrive = scenario(6, ('When ${name} arrives', [], []))
+        arrive.steps[0].args = StepArguments([StepArgument('${name}', 'Alice', ArgKind.EMBEDDED)])
+        arrive.steps[0].model_info['MOD'] = ['${name}= party.guests']
+        self.assertEqual(DependencyAnalysis([invite, arrive, self.buy]).clusters, [[5, 6], [1]])
+
+    def test_scenarios_evaluating_the_same_expressions_are_equivalent(self):
+        send_again = scenario(5, ('Given a card with names', ['card.names'], []),
+                              ('When the card is posted', [], ['card.sent = True']))
+        deps = DependencyAnalysis([self.buy, self.send, send_again, self.deliver])
+        self.assertEqual(deps.equivalents, {3: [5], 5: [3]})
+
+    def test_argument_values_in_expressions_make_scenarios_different(self):
+        first = scenario(1, ('When ${name} signs', ['new card'], ['card.signed_by = ${name}']))
+        second = scenario(2, ('When ${name} signs', ['new card'], ['card.signed_by = ${name}']))
+        first.steps[0].args = StepArguments([StepArgument('${name}', 'Johan')])
+        second.steps[0].args = StepArguments([StepArgument('${name}', 'Tannaz')])
+        self.assertEqual(DependencyAnalysis([first, second]).equivalents, {})
+        second.steps[0].args = StepArguments([StepArgument('${name}', 'Johan')])
+        self.assertEqual(DependencyAnalysis([first, second]).equivalents, {1: [2], 2: [1]})
+
+    def test_scenarios_with_modifiers_are_never_equivalent(self):
+        send_again = scenario(5, ('Given a signed card', ['card.names'], []),
+                              ('When the card is sent', [], ['card.sent = True']))
+        send_again.steps[0].model_info['MOD'] = ['${x}= [1, 2]']
+        self.assertEqual(DependencyAnalysis([self.buy, self.send, send_again]).equivalents, {})
+
+    def test_refiners_write_what_the_exit_conditions_read(self):
+        party = scenario(5, ('When the party happens', ['new party'], ['party.cake == True']))
+        bake = scenario(6, ('When the cake is baked', ['party'], ['party.cake = True']))
+        decorate = scenario(7, ('When balloons are hung', ['party'], ['party.balloons = True']))
+        deps = DependencyAnalysis([party, bake, decorate, self.buy])
+        self.assertEqual(deps.refiners(party.steps[0]), {5, 6})
+
+    def test_any_scenario_can_refine_conditions_on_the_scenario_scope(self):
+        outer = scenario(1, ('When the party happens', ['scenario.level = 1'], ['scenario.level == 2']))
+        self.assertIsNone(DependencyAnalysis([outer, self.buy]).refiners(outer.steps[0]))
+
+    def test_exit_conditions_with_side_effects_can_be_met_by_any_scenario(self):
+        party = scenario(5, ('When the party happens', ['new party', 'party.guests = 0'],
+                             ['party.guests += 1', 'party.guests == 2']))
+        self.assertIsNone(DependencyAnalysis([party, self.buy]).refiners(party.steps[0]))
+
+
+class TestExitConditionTracking(unittest.TestCase):
+    def setUp(self):
+        self.party = scenario(5, ('When the party happens', ['new party', 'party.cake = False'],
+                                  ['party.cake == True']))
+        self.bake = scenario(6, ('When the cake is baked', ['party'], ['party.cake = True']))
+        self.decorate = scenario(7, ('When balloons are hung', ['party'], ['party.balloons = True']))
+        self.deps = DependencyAnalysis([self.party, self.bake, self.decorate])
+        self.tracestate = TraceState([5, 6, 7])
+        modeller.try_to_fit_in_scenario(self.party, self.tracestate)
+        self.assertTrue(self.tracestate.is_refinement_active())
+
+    def test_exit_is_unchanged_when_nothing_it_reads_was_written(self):
+        self.tracestate.confirm_full_scenario(7, self.decorate, self.tracestate.model)
+        self.assertTrue(self.deps.exit_unchanged(self.tracestate))
+
+    def test_exit_must_be_checked_when_something_it_reads_was_written(self):
+        self.tracestate.confirm_full_scenario(6, self.bake, self.tracestate.model)
+        self.assertFalse(self.deps.exit_unchanged(self.tracestate))
+
+    def test_unchanged_exit_is_not_evaluated(self):
+        with patch.object(modeller, 'exit_conditions_met', wraps=modeller.exit_conditions_met) as check:
+            modeller.try_to_fit_in_scenario(self.decorate, self.tracestate, self.deps.exit_unchanged)
+            self.assertEqual(self.tracestate.id_trace, ['5.1'])
+            check.assert_not_called()
+            modeller.try_to_fit_in_scenario(self.bake, self.tracestate, self.deps.exit_unchanged)
+            check.assert_called_once()
+        self.assertEqual(self.tracestate.id_trace, ['5.1', '6', '5.0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
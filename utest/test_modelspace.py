@@ -33,7 +33,7 @@
 import sys
 import unittest
 
-from robotmbt.modelspace import ModelSpace, ModellingError
+from robotmbt.modelspace import ModelSpace, ModellingError, OptionCache
 
 
 class TestModelSpace(unittest.TestCase):
@@ -113,6 +113,25 @@ class TestModelSpace(unittest.TestCase):
                                                    "foo2:\n"
                                                    "    bar=1313\n")
 
+    def test_merge_adds_domain_terms_and_aliases(self):
+        self.m.add_prop('foo1')
+        other = ModelSpace()
+        other.add_prop('foo2')
+        other.process_expression('foo2.bar = baz')
+        self.m.merge(other)
+        self.assertEqual(self.m.get_status_text(), "foo1:\n"
+                                                   "foo2:\n"
+                                                   "    bar=baz\n")
+        self.assertEqual(self.m.values, dict(baz='baz'))
+        other.process_expression('foo2.bar = 13')
+        self.assertEqual(self.m.process_expression('foo2.bar'), 'baz')
+
+    def test_merge_refuses_shared_domain_terms(self):
+        self.m.add_prop('foo')
+        other = ModelSpace()
+        other.add_prop('foo')
+        self.assertRaises(ModellingError, self.m.merge, other)
+
     def test_list_attribute(self):
         self.m.add_prop('foo')
         self.m.process_expression('foo.bar = [1, 2, 3]')
@@ -403,5 +422,51 @@ class TestScenarioScopeVars(unittest.TestCase):
                                                    "    foo2=bar2\n")
 
 
+class TestOptionCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = OptionCache()
+        self.m = ModelSpace()
+        self.m.process_expression('new party')
+        self.m.process_expression("party.guests = ['Alice', 'Bob']")
+
+    def test_options_are_evaluated_against_the_model(self):
+        self.assertEqual(self.cache.evaluate(self.m, 'party.guests'), ['Alice', 'Bob'])
+        self.assertEqual(len(self.cache), 1)
+
+    def test_same_model_state_reuses_the_options(self):
+        self.cache.evaluate(self.m, 'party.guests')
+        self.m.process_expression = None  # evaluating again would fail
+        self.assertEqual(self.cache.evaluate(self.m.copy(), 'party.guests'), ['Alice', 'Bob'])
+
+    def test_cached_options_are_returned_as_copies(self):
+        self.cache.evaluate(self.m, 'party.guests').append('Carol')
+        self.assertEqual(self.cache.evaluate(self.m, 'party.guests'), ['Alice', 'Bob'])
+
+    def test_changes_to_referenced_attributes_are_noticed(self):
+        self.cache.evaluate(self.m, 'party.guests')
+        self.m.process_expression("party.guests.append('Carol')")
+        self.assertEqual(self.cache.evaluate(self.m, 'party.guests'), ['Alice', 'Bob', 'Carol'])
+
+    def test_changes_to_other_attributes_keep_the_options(self):
+        self.cache.evaluate(self.m, 'party.guests')
+        self.m.process_expression('new cake')
+        self.cache.evaluate(self.m, 'party.guests')
+        self.assertEqual(len(self.cache), 1)
+
+    def test_expressions_with_unknown_names_are_not_cached(self):
+        self.assertEqual(self.cache.evaluate(self.m, '[foo, bar]'), ['foo', 'bar'])
+        self.assertEqual(len(self.cache), 0)
+
+    def test_comprehension_variables_do_not_prevent_caching(self):
+        self.assertEqual(self.cache.evaluate(self.m, '[g for g in party.guests if g != "Bob"]'), ['Alice'])
+        self.assertEqual(len(self.cache), 1)
+
+    def test_cache_size_is_bounded(self):
+        cache = OptionCache(maxsize=2)
+        for n in range(5):
+            cache.evaluate(self.m, f'list(range({n}))')
+        self.assertEqual(len(cache), 2)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2026, J. Foederer
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import subprocess
+import sys
+import unittest
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Robot Framework itself is already loaded when Robot imports the library. The budget
+# only covers the time that importing robotmbt adds on top of that.
+STARTUP_BUDGET = 0.5  # seconds
+
+PROBE = """
+import sys, time
+import robot.api, robot.running
+start = time.perf_counter()
+import robotmbt
+print(time.perf_counter() - start)
+print(','.join(sorted(name for name in sys.modules
+                      for heavy in ('networkx', 'bokeh', 'grandalf', 'jsonpickle', 'robotmbt.visualise')
+                      if name == heavy or name.startswith(heavy + '.'))))
+"""
+
+
+class TestStartup(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A fresh interpreter, because other tests may have imported the modules already
+        result = subprocess.run([sys.executable, '-c', PROBE], cwd=PACKAGE_ROOT,
+                                capture_output=True, text=True, check=True)
+        duration, modules = result.stdout.splitlines()
+        cls.duration = float(duration)
+        cls.loaded_visualisation_modules = modules
+
+    def test_visualisation_is_not_loaded_at_library_import(self):
+        self.assertEqual(self.loaded_visualisation_modules, '')
+
+    def test_library_import_stays_within_budget(self):
+        self.assertLess(self.duration, STARTUP_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
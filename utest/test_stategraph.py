@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2026, J. Foederer
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import unittest
+from robotmbt.stategraph import StateGraph
+from robotmbt.suitedata import Scenario, Step
+from robotmbt.tracestate import TraceState
+
+
+def scenario(src_id, *steps):
+    s = Scenario(f"scenario {src_id}")
+    s.src_id = src_id
+    for text, model_in, model_out in steps:
+        step = Step(text, parent=s)
+        step.model_info = dict(IN=model_in, OUT=model_out)
+        s.steps.append(step)
+    return s
+
+
+class TestStateGraph(unittest.TestCase):
+    def setUp(self):
+        self.install = scenario(1, ('When the light is installed', ['new light', 'light.on = False'], []))
+        self.switch_on = scenario(2, ('When switching the light on', ['light.on == False'], ['light.on = True']))
+        self.switch_off = scenario(3, ('When switching the light off', ['light.on == True'], ['light.on = False']))
+        self.leave = scenario(4, ('Given the light is on', ['light.on == True'], []),
+                              ('When leaving the room', ['light.on'], ['light.on == False']))
+        self.scenarios = [self.install, self.switch_on, self.switch_off]
+
+    def test_all_reachable_states_are_found(self):
+        graph = StateGraph(self.scenarios, max_depth=10, max_states=100)
+        self.assertEqual(len(graph.states), 3)
+        self.assertEqual(graph.n_transitions, 3)
+        self.assertTrue(graph.complete)
+        self.assertTrue(graph.exact)
+        self.assertEqual(graph.covered, {1, 2, 3})
+
+    def test_exploration_is_limited_by_depth(self):
+        graph = StateGraph(self.scenarios, max_depth=1, max_states=100)
+        self.assertEqual(len(graph.states), 2)
+        self.assertEqual(graph.covered, {1})
+        self.assertFalse(graph.complete)
+
+    def test_exploration_is_limited_by_number_of_states(self):
+        graph = StateGraph(self.scenarios, max_depth=10, max_states=2)
+        self.assertEqual(len(graph.states), 2)
+        self.assertFalse(graph.complete)
+
+    def test_scenarios_that_are_never_covered_are_unreachable(self):
+        repair = scenario(5, ('When the light is repaired', ['light.broken'], ['light.broken = False']))
+        graph = StateGraph(self.scenarios + [repair], max_depth=10, max_states=100)
+        self.assertTrue(graph.exact)
+        self.assertNotIn(5, graph.covered)
+        self.assertIsNone(graph.walk({1, 2, 3, 5}))
+
+    def test_walk_covers_all_scenarios(self):
+        graph = StateGraph(self.scenarios, max_depth=10, max_states=100)
+        path = graph.walk({1, 2, 3})
+        self.assertEqual([edge.index for edge in path], [1, 2, 3])
+
+    def test_refinement_is_part_of_the_transition(self):
+        graph = StateGraph(self.scenarios + [self.leave], max_depth=10, max_states=100)
+        refined = [edge for edges in graph.transitions.values() for edge in edges if edge.index == 4]
+        self.assertEqual([edge.covers for edge in refined], [{3, 4}])
+        self.assertEqual(refined[0].target, graph.transitions[graph.initial][0].target)
+
+    def test_refinements_that_only_occur_inside_other_scenarios_are_covered(self):
+        switch_off = scenario(3, ('Given the light is on', ['light.on == True'], []),
+                              ('When switching the light off', ['scenario.inner = True'], ['light.on = False']))
+        graph = StateGraph([self.install, self.switch_on, switch_off, self.leave], max_depth=10, max_states=100)
+        self.assertEqual(graph.covered, {1, 2, 3, 4})
+
+    def test_walk_prefers_transitions_covering_more_scenarios(self):
+        graph = StateGraph(self.scenarios + [self.leave], max_depth=10, max_states=100)
+        path = graph.walk({1, 2, 3, 4})
+        self.assertEqual([edge.index for edge in path], [1, 2, 4])
+
+    def test_replay_reproduces_refinement_in_the_trace(self):
+        graph = StateGraph(self.scenarios + [self.leave], max_depth=10, max_states=100)
+        tracestate = TraceState([1, 2, 3, 4])
+        StateGraph.replay(graph.walk({1, 2, 3, 4}), tracestate)
+        self.assertEqual(tracestate.id_trace, ['1', '2', '4.1', '3', '4.0'])
+        self.assertEqual([s.name for s in tracestate.get_trace()],
+                         ['scenario 1', 'scenario 2', 'scenario 4 (part 1)', 'scenario 3', 'scenario 4'])
+        self.assertTrue(tracestate.coverage_reached())
+
+    def test_replay_numbers_repeated_scenarios(self):
+        graph = StateGraph(self.scenarios, max_depth=10, max_states=100)
+        path = graph.walk({1, 2, 3})
+        tracestate = TraceState([1, 2, 3])
+        StateGraph.replay(path + path[1:], tracestate)
+        self.assertEqual([s.name for s in tracestate.get_trace()][-2:],
+                         ['scenario 2 (rep 2)', 'scenario 3 (rep 2)'])
+
+
+if __name__ == '__main__':
+    unittest.main()
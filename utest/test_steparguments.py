@@ -117,6 +117,12 @@ class TestStepArgument(unittest.TestCase):
         self.assertEqual(arg2.org_value, 7)
         self.assertEqual(arg2.value, 8)
 
+    def test_default_arguments_stay_default_when_copying(self):
+        arg1 = StepArgument('foo', 7, is_default=True)
+        arg2 = arg1.copy()
+        self.assertTrue(arg2.is_default)
+        self.assertEqual(arg2.codestring, '7')
+
     def test_copies_are_independent(self):
         arg1 = StepArgument('foo', 7, ArgKind.POSITIONAL)
         arg1.value = 8
@@ -237,6 +243,19 @@ class TestStepArguments(unittest.TestCase):
         self.assertEqual(argset.fill_in_args("\t${foo1} and ${foo2}@#$%s  $$$$${foo2}${foo1}}"),
                          "\tbar1 and bar2@#$%s  $$$$bar2bar1}")
 
+    def test_filled_in_values_are_not_filled_in_again(self):
+        argset = StepArguments([StepArgument('foo1', '${foo2}'),
+                                StepArgument('foo2', 'bar2')])
+        self.assertEqual(argset.fill_in_args("${foo1} ${foo2}"), "${foo2} bar2")
+
+    def test_revision_changes_when_a_value_is_assigned(self):
+        argset = StepArguments([StepArgument('foo1', 'bar1'),
+                                StepArgument('foo2', 'bar2')])
+        revision = argset.revision
+        self.assertEqual(argset.revision, revision)
+        argset['${foo2}'].value = 'bar2'
+        self.assertNotEqual(argset.revision, revision)
+
     def test_can_use_robot_arguments_in_code_fragments(self):
         args = StepArguments([StepArgument('foo1', '3bar'),  # 3bar needs to be converted to a valid identifier
                               StepArgument('foo2', '3bar')])
@@ -282,6 +301,13 @@ class TestStepArguments(unittest.TestCase):
         self.assertEqual(argset['${FoO1}'].value, 'bar1')
         self.assertEqual(argset['${foo2}'].value, 'bar2')
 
+    def test_arguments_can_be_indexed_by_position(self):
+        arg1 = StepArgument('foo1', 'bar1')
+        arg2 = StepArgument('foo2', 'bar2')
+        argset = StepArguments([arg1, arg2])
+        self.assertEqual(argset[0].value, 'bar1')
+        self.assertEqual(argset[-1].value, 'bar2')
+
     def test_set_is_modified_if_any_arg_is_modified(self):
         arg1 = StepArgument('foo1', 'bar1')
         arg2 = StepArgument('foo2', 'bar2')
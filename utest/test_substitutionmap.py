@@ -30,8 +30,9 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import random
 import unittest
-from robotmbt.substitutionmap import Constraint, SubstitutionMap
+from robotmbt.substitutionmap import Constraint, LazyConstraint, OptionDomain, SubstitutionMap
 
 
 class TestSubstitutionMap(unittest.TestCase):
@@ -212,6 +213,150 @@ class TestSubstitutionMap(unittest.TestCase):
             else:
                 assert False, "Invalid solution generated"
 
+    def test_large_map_without_solution_is_rejected_without_exhaustive_search(self):
+        sm = SubstitutionMap()
+        for example_value in range(30):
+            sm.substitute(f'E{example_value}', list(range(29)))
+        self.assertRaises(ValueError, sm.solve)
+
+    def test_choices_that_leave_no_unique_value_for_others_are_avoided(self):
+        for _ in range(20):
+            sm = SubstitutionMap()
+            sm.substitute('X', [0, 1, 2, 3])
+            sm.substitute('Y', [0, 1, 2, 3])
+            for example_value in 'PQRS':
+                sm.substitute(example_value, [2, 3, 4, 5])
+            sm.solve()
+            self.assertEqual({sm.solution['X'], sm.solution['Y']}, {0, 1})
+            self.assertEqual({sm.solution[e] for e in 'PQRS'}, {2, 3, 4, 5})
+
+    def test_solution_is_reproducible_with_the_same_seed(self):
+        sm = SubstitutionMap()
+        for example_value in 'ABCDE':
+            sm.substitute(example_value, list(range(10)))
+        random.seed('fixed')
+        first = sm.solve()
+        random.seed('fixed')
+        self.assertEqual(sm.solve(), first)
+
+    def test_large_ranges_are_not_built_in_memory(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', range(10**15))
+        sm.substitute('B', range(10**15))
+        self.assertIsInstance(sm.substitutions['A'], LazyConstraint)
+        sm.solve()
+        self.assertIn(sm.solution['A'], range(10**15))
+        self.assertNotEqual(sm.solution['A'], sm.solution['B'])
+
+    def test_small_ranges_are_regular_option_sets(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', range(10))
+        self.assertIsInstance(sm.substitutions['A'], Constraint)
+
+    def test_option_list_narrows_lazy_domain_to_regular_option_set(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', range(10**15))
+        sm.substitute('A', [-1, 5, 7])
+        self.assertIsInstance(sm.substitutions['A'], Constraint)
+        self.assertEqual(sm.substitutions['A'].optionset, [5, 7])
+
+    def test_overlapping_lazy_ranges_are_intersected(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', range(10**15))
+        sm.substitute('A', range(10**15 - 3, 10**16))
+        self.assertEqual(sm.substitutions['A'].optionset, [10**15 - 3, 10**15 - 2, 10**15 - 1])
+        self.assertRaises(ValueError, sm.substitute, 'A', range(10**15, 10**16))
+
+    def test_lazy_domain_takes_remaining_values_from_regular_options(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', [1, 2])
+        sm.substitute('B', range(-10**5, 3))
+        sm.substitute('B', range(0, 10**5))
+        sm.substitute('C', [0, 1, 2])
+        sm.solve()
+        self.assertEqual(sorted(sm.solution.values()), [0, 1, 2])
+
+    def test_lazy_domains_without_common_option_have_no_solution(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', range(0, 10**6, 2))
+        self.assertRaises(ValueError, sm.substitute, 'A', range(1, 10**6, 2))
+        sm = SubstitutionMap()
+        sm.substitute('A', range(0, 10**6, 2))
+        sm.substitute('A', range(1, 10**6, 4))
+        self.assertRaises(ValueError, sm.solve)
+
+    def test_ties_in_number_of_options_keep_the_order_of_the_previous_sort(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', [1, 2, 3, 4])
+        sm.substitute('B', [5, 6, 7])
+        sm.substitute('C', [1, 8])
+        order = []
+
+        def choose(example_value, options, partial_solution):
+            order.append(example_value)
+            return options[0]
+        sm.solve(choose)
+        # A drops to 3 options after C takes 1, but B already sorted before A
+        self.assertEqual(order, ['C', 'B', 'A'])
+
+    def test_solutions_can_be_counted(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', [1, 2])
+        sm.substitute('B', [2, 3])
+        sm.substitute('C', [3, 4])
+        self.assertEqual(sm.count_solutions(), 4)
+        sm.substitute('C', [3])
+        self.assertEqual(sm.count_solutions(), 1)
+
+    def test_counting_solutions_stops_at_limit(self):
+        sm = SubstitutionMap()
+        for example_value in 'ABCDEFGH':
+            sm.substitute(example_value, list(range(10)))
+        self.assertEqual(sm.count_solutions(limit=1000), 1000)
+        self.assertEqual(sm.count_solutions(limit=1), 1)
+
+    def test_counting_solutions_requires_a_positive_limit(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', range(10**15))
+        self.assertRaises(ValueError, sm.count_solutions, limit=0)
+        self.assertRaises(ValueError, sm.count_solutions, limit=-1)
+
+    def test_map_without_solution_counts_zero_solutions(self):
+        sm = SubstitutionMap()
+        for example_value in 'ABC':
+            sm.substitute(example_value, [1, 2])
+        self.assertEqual(sm.count_solutions(), 0)
+        self.assertEqual(list(sm.iter_solutions()), [])
+
+    def test_iterating_solutions_yields_each_solution_once(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', [1, 2, 3])
+        sm.substitute('B', [1, 2, 3])
+        sm.substitute('C', [2, 3, 4])
+        solutions = [tuple(solution.values()) for solution in sm.iter_solutions()]
+        expected = [(a, b, c) for a in [1, 2, 3] for b in [1, 2, 3] for c in [2, 3, 4] if len({a, b, c}) == 3]
+        self.assertCountEqual(solutions, expected)
+
+    def test_solution_order_is_reproducible_with_the_same_seed(self):
+        sm = SubstitutionMap()
+        for example_value in 'ABCD':
+            sm.substitute(example_value, list(range(6)))
+        random.seed('fixed')
+        first = list(sm.iter_solutions())
+        random.seed('fixed')
+        self.assertEqual(list(sm.iter_solutions()), first)
+
+    def test_solutions_for_lazy_domains_are_generated_on_demand(self):
+        sm = SubstitutionMap()
+        sm.substitute('A', [1, 2])
+        sm.substitute('B', range(10**15))
+        solutions = sm.iter_solutions()
+        for _ in range(10):
+            solution = next(solutions)
+            self.assertNotEqual(solution['A'], solution['B'])
+        self.assertEqual(sm.count_solutions(limit=50), 50)
+        self.assertRaises(ValueError, sm.count_solutions)
+
     def test_substitution_map_copies_are_independent(self):
         sm = SubstitutionMap()
         sm.substitute('A', [1, 2, 3])
@@ -382,6 +527,30 @@ class TestConstraint(unittest.TestCase):
         cc = c.copy()
         self.assertEqual(c.optionset, cc.optionset)
 
+    def test_undone_option_returns_to_its_original_position(self):
+        c = Constraint(['two', 'one', 'three'])
+        c.remove_option('two')
+        c.undo_remove()
+        self.assertEqual(c.optionset, ['two', 'one', 'three'])
+
+    def test_constraints_keep_their_own_order_in_a_shared_domain(self):
+        domain = OptionDomain()
+        c1 = Constraint([1, 2, 3], domain)
+        c2 = Constraint([3, 2, 1, 4], domain)
+        self.assertEqual(domain.values, [1, 2, 3, 4])
+        c2.add_constraint([1, 3, 5])
+        self.assertEqual(c1.optionset, [1, 2, 3])
+        self.assertEqual(c2.optionset, [3, 1])
+        self.assertNotIn(5, domain.values)
+
+    def test_unhashable_values_in_additional_constraint_are_ignored(self):
+        c = Constraint(['one', 'two'])
+        c.add_constraint(['two', ['one']])
+        self.assertEqual(c.optionset, ['two'])
+
+    def test_constraint_cannot_be_created_from_unhashable_values(self):
+        self.assertRaises(ValueError, Constraint, [['one'], ['two']])
+
 
 if __name__ == '__main__':
     unittest.main()
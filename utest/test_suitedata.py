@@ -283,6 +283,22 @@ class TestScenarios(unittest.TestCase):
         self.assertEqual(dup.steps[0].keyword, self.scenario.steps[0].keyword)
         self.assertNotEqual(dup.steps[-1].keyword, self.scenario.steps[-1].keyword)
 
+    def test_derived_scenarios_share_their_steps(self):
+        dup = self.scenario.derive()
+        dup.name = "other name"
+        dup.steps.append(Step('extra step', parent=dup))
+        self.assertNotEqual(dup.name, self.scenario.name)
+        self.assertIs(dup.steps[0], self.scenario.steps[0])
+        self.assertEqual(len(dup.steps), len(self.scenario.steps) + 1)
+
+    def test_owned_steps_are_independent(self):
+        dup = self.scenario.derive()
+        step = dup.own_step(1)
+        self.assertIs(dup.steps[1], step)
+        self.assertIsNot(step, self.scenario.steps[1])
+        self.assertEqual(step.keyword, self.scenario.steps[1].keyword)
+        self.assertIs(dup.steps[2], self.scenario.steps[2])
+
     def test_exteranally_determined_attributes_are_copied_along(self):
         self.scenario.src_id = 7
 
@@ -385,6 +401,15 @@ class TestSteps(unittest.TestCase):
         step.args['${bar}'].value = 'new bar'
         self.assertEqual(str(step), RobotKwStub.STEPTEXT.replace('bar_value', 'new bar'))
 
+    def test_step_str_follows_argument_changes(self, mock):
+        step = Step(RobotKwStub.STEPTEXT, parent=None)
+        step.add_robot_dependent_data(RobotKwStub())
+        self.assertEqual(str(step), RobotKwStub.STEPTEXT)
+        step.args['${bar}'].value = 'new bar'
+        self.assertEqual(str(step), RobotKwStub.STEPTEXT.replace('bar_value', 'new bar'))
+        step.args['${bar}'].value = 'bar_value'
+        self.assertEqual(str(step), RobotKwStub.STEPTEXT)
+
     def test_all_arguments_are_part_of_the_full_keyword_text(self, mock):
         step = Step(RobotKwStub.STEPTEXT, 'posA', 'pos2=posB', 'named1=namedA', parent=None)
         self.assertEqual(step.full_keyword, f"{RobotKwStub.STEPTEXT}    posA    pos2=posB    named1=namedA")
@@ -493,6 +518,7 @@ class RobotKwStub:
 
 class StubStepArguments(list):
     modified = True  # trigger modified status to get arguments processed, rather then just echoed
+    revision = (0,)
 
 
 class StubArgument(SimpleNamespace):
@@ -31,9 +31,26 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import unittest
+from contextlib import nullcontext
 from unittest.mock import patch
 
+from robotmbt import modeller
+from robotmbt.dependencies import DependencyAnalysis
+from robotmbt.steparguments import ArgKind, StepArgument, StepArguments
+from robotmbt.suitedata import Suite, Scenario, Step
 from robotmbt.suiteprocessors import SuiteProcessors
+from robotmbt.tracestate import TraceState
+
+
+def add_scenarios(suite, *scenarios):
+    """Adds a scenario with a single when-step to the suite for each (name, model info) pair"""
+    for name, model_info in scenarios:
+        scenario = Scenario(name, parent=suite)
+        step = Step(f'When {name} is done', parent=scenario)
+        step.model_info = model_info
+        scenario.steps.append(step)
+        suite.scenarios.append(scenario)
+    return suite
 
 
 @patch('robotmbt.suiteprocessors.random.seed')
@@ -94,5 +111,252 @@ class TestRandomSeeding(unittest.TestCase):
             self.assertTrue(3 <= len(word) <= 6)
 
 
+class TestFlatten(unittest.TestCase):
+    def setUp(self):
+        self.top = Suite('top')
+        self.top.setup = Step('top setup', parent=self.top)
+        self.sub = Suite('sub', parent=self.top)
+        self.sub.setup = Step('sub setup', parent=self.sub)
+        self.sub.teardown = Step('sub teardown', parent=self.sub)
+        self.subsub = Suite('subsub', parent=self.sub)
+        self.subsub.setup = Step('subsub setup', parent=self.subsub)
+        self.subsub.teardown = Step('subsub teardown', parent=self.subsub)
+        self.top.suites = [self.sub]
+        self.sub.suites = [self.subsub]
+        for suite in (self.top, self.sub, self.subsub):
+            scenario = Scenario(f"{suite.name} scenario", parent=suite)
+            scenario.steps = [Step(f"{suite.name} step", parent=scenario)]
+            suite.scenarios = [scenario]
+        self.sub.scenarios[0].setup = Step('scenario setup', parent=self.sub.scenarios[0])
+        self.sub.scenarios[0].teardown = Step('scenario teardown', parent=self.sub.scenarios[0])
+
+    def test_scenarios_of_sub_suites_come_first(self):
+        flat = SuiteProcessors().flatten(self.top)
+        self.assertEqual(flat.suites, [])
+        self.assertEqual([s.name for s in flat.scenarios], ['subsub scenario', 'sub scenario', 'top scenario'])
+
+    def test_setups_and_teardowns_become_steps(self):
+        flat = SuiteProcessors().flatten(self.top)
+        self.assertEqual([str(step) for step in flat.scenarios[0].steps],
+                         ['sub setup', 'subsub setup', 'subsub step', 'subsub teardown', 'sub teardown'])
+        self.assertEqual([str(step) for step in flat.scenarios[1].steps],
+                         ['sub setup', 'scenario setup', 'sub step', 'scenario teardown', 'sub teardown'])
+        self.assertEqual([str(step) for step in flat.scenarios[2].steps], ['top step'])
+        self.assertTrue(all(s.setup is None and s.teardown is None for s in flat.scenarios))
+        self.assertIs(flat.setup, self.top.setup)
+
+    def test_input_suite_is_unchanged(self):
+        SuiteProcessors().flatten(self.top)
+        self.assertEqual(self.top.suites, [self.sub])
+        self.assertEqual(len(self.sub.scenarios[0].steps), 1)
+        self.assertIsNotNone(self.sub.scenarios[0].setup)
+
+    def test_steps_are_shared_with_the_input_suite(self):
+        flat = SuiteProcessors().flatten(self.top)
+        self.assertIs(flat.scenarios[2].steps[0], self.top.scenarios[0].steps[0])
+
+    def test_modifier_plans_are_reset_for_the_flattened_steps(self):
+        self.sub.scenarios[0].modifier_plan = []
+        flat = SuiteProcessors().flatten(self.top)
+        self.assertIsNone(flat.scenarios[1].modifier_plan)
+        self.assertEqual(self.sub.scenarios[0].modifier_plan, [])
+
+
+class TestSoakMode(unittest.TestCase):
+    def setUp(self):
+        self.suite = add_scenarios(Suite('soak suite'),
+                                   *[(f'scenario {name}', dict(IN=['None'], OUT=['None'])) for name in 'ABC'])
+
+    def run_soak(self, **options):
+        out_suite = SuiteProcessors().process_test_suite(self.suite, seed='soak', mode='soak', **options)
+        trace = out_suite.scenarios[:]
+        for batch in out_suite.scenario_feed:
+            trace += batch
+        return trace
+
+    def test_soak_mode_requires_a_limit(self):
+        self.assertRaises(ValueError, SuiteProcessors().process_test_suite, self.suite, mode='soak')
+
+    def test_soak_run_ends_after_max_steps(self):
+        trace = self.run_soak(max_steps=50)
+        self.assertEqual(len(trace), 50)
+        self.assertEqual(set(s.src_id for s in trace), {1, 2, 3})
+
+    def test_soak_run_accepts_max_steps_as_text(self):
+        self.assertEqual(len(self.run_soak(max_steps='5')), 5)
+
+    @patch('robotmbt.suiteprocessors.time.monotonic')
+    def test_soak_run_ends_after_max_duration(self, mock_clock):
+        mock_clock.side_effect = range(1000)
+        trace = self.run_soak(max_duration='30 seconds')
+        self.assertGreater(len(trace), 0)
+        self.assertLess(len(trace), 30)
+
+    def test_first_scenarios_are_held_back_for_rewinding(self):
+        out_suite = SuiteProcessors().process_test_suite(self.suite, seed='soak', mode='soak', max_steps=50)
+        self.assertEqual(len(out_suite.scenarios), 1)
+        self.assertEqual(len(next(out_suite.scenario_feed)), 1)
+
+    def test_soak_run_with_refinement_continues_past_the_window(self):
+        self.suite = add_scenarios(Suite('party'),
+                                   ('party', dict(IN=['new party', 'party.cake = False'],
+                                                  OUT=['party.cake == True', 'del party'])),
+                                   ('bake cake', dict(IN=['party.cake == False'], OUT=['party.cake = True'])))
+        trace = self.run_soak(max_steps=5 * SuiteProcessors.SOAK_WINDOW)
+        self.assertGreaterEqual(len(trace), 5 * SuiteProcessors.SOAK_WINDOW)
+        self.assertEqual([s.name for s in trace[:3]], ['party (part 1)', 'bake cake', 'party'])
+
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        self.suite = add_scenarios(Suite('sharded suite'),
+                                   ('open A', dict(IN=['new session'], OUT=['session'])),
+                                   ('open B', dict(IN=['new session'], OUT=['session'])),
+                                   ('close X', dict(IN=['session'], OUT=['del session'])),
+                                   ('close Y', dict(IN=['session'], OUT=['del session'])))
+
+    def run_shard(self, shard, **options):
+        out_suite = SuiteProcessors().process_test_suite(self.suite, seed='shard', shards=2, shard=shard, **options)
+        return [s.name for s in out_suite.scenarios]
+
+    def test_shards_together_cover_the_full_trace(self):
+        first, second = self.run_shard(1), self.run_shard(2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 2)
+        self.assertEqual(sorted(first + second), ['close X', 'close Y', 'open A', 'open B'])
+        for shard in (first, second):
+            self.assertTrue(shard[0].startswith('open'))
+            self.assertTrue(shard[1].startswith('close'))
+
+    def test_sharding_requires_a_fixed_seed(self):
+        self.assertRaises(ValueError, SuiteProcessors().process_test_suite, self.suite, shards=2, shard=1)
+
+    def test_shard_must_be_in_range(self):
+        self.assertRaises(ValueError, self.run_shard, 3)
+        self.assertRaises(ValueError, self.run_shard, 0)
+
+
+class TestIndependentClusters(unittest.TestCase):
+    def setUp(self):
+        self.suite = add_scenarios(Suite('clustered suite'),
+                                   ('use light', dict(IN=['light.on == False'], OUT=['light.on = True'])),
+                                   ('open door', dict(IN=['new door'], OUT=['door.open = True'])),
+                                   ('install light', dict(IN=['new light'], OUT=['light.on = False'])),
+                                   ('close door', dict(IN=['door.open'], OUT=['door.open = False'])))
+
+    def test_clusters_are_solved_separately_and_concatenated(self):
+        out_suite = SuiteProcessors().process_test_suite(self.suite, seed='clusters')
+        names = [s.name for s in out_suite.scenarios]
+        self.assertEqual(len(names), 4)
+        light, door = names.index('install light'), names.index('open door')
+        self.assertEqual(names[light + 1], 'use light')
+        self.assertEqual(names[door + 1], 'close door')
+
+    def test_data_coverage_keeps_a_single_cluster(self):
+        processor = SuiteProcessors()
+        processor.process_test_suite(self.suite, seed='clusters')
+        self.assertEqual(len(processor._independent_clusters()), 2)
+        processor.data_coverage_strength = 2
+        self.assertEqual(processor._independent_clusters(), [processor.shuffled])
+
+
+class TestEquivalentScenarios(unittest.TestCase):
+    def test_equivalent_scenarios_are_rejected_together(self):
+        suite = add_scenarios(Suite('light'),
+                              ('install light', dict(IN=['new light'], OUT=['light.on = False'])),
+                              ('use light', dict(IN=['light.on == False'], OUT=['light.on = True'])),
+                              ('use light again', dict(IN=['light.on == False'], OUT=['light.on = True'])),
+                              ('switch light off', dict(IN=['light.on == True'], OUT=['light.on = False'])))
+        processor = SuiteProcessors()
+        out_suite = processor.process_test_suite(suite, seed='clusters')
+        self.assertEqual({s.name for s in out_suite.scenarios},
+                         {'install light', 'use light', 'use light again', 'switch light off'})
+        self.assertEqual(processor.dependencies.equivalents, {2: [3], 3: [2]})
+        tracestate = TraceState(processor.shuffled)
+        processor._reject_equivalents(2, tracestate)
+        self.assertEqual(tracestate.tried, (3,))
+
+
+class TestPartialOrderReduction(unittest.TestCase):
+    def test_commuting_scenarios_are_tried_in_a_single_order(self):
+        features = ['f1', 'f2', 'f3', 'f4']
+        suite = add_scenarios(
+            Suite('feature toggles'),
+            ('create app', dict(IN=['new app', 'app.stage = 0'] + [f'app.{f} = False' for f in features], OUT=[])),
+            *[(f'enable {f}', dict(IN=[f'app.{f} == False'], OUT=[f'app.{f} = True'])) for f in features],
+            ('prepare', dict(IN=[' and '.join(f'not app.{f}' for f in features) + ' and app.stage == 0'],
+                             OUT=['app.stage = 1'])),
+            ('finish', dict(IN=[' and '.join(f'app.{f}' for f in features) + ' and app.stage == 1'],
+                            OUT=['del app'])))
+        counts = []
+        for reduction in (False, True):
+            no_reduction = patch.object(DependencyAnalysis, 'commute', return_value=False)
+            with patch.object(modeller, 'try_to_fit_in_scenario', wraps=modeller.try_to_fit_in_scenario) as fit:
+                with nullcontext() if reduction else no_reduction:
+                    out_suite = SuiteProcessors().process_test_suite(suite, seed='bench')
+            counts.append(fit.call_count)
+            self.assertEqual(out_suite.scenarios[1].name, 'prepare')
+            self.assertEqual(out_suite.scenarios[-1].name, 'finish')
+        self.assertLess(counts[1], counts[0])
+
+    def test_scenarios_are_not_put_to_sleep_when_their_modifier_options_change(self):
+        for seed in range(1, 8):
+            suite = add_scenarios(Suite('party'),
+                                  ('start party', dict(IN=['new party'], OUT=["party.guests = ['Bob']"])),
+                                  ('replace guests', dict(IN=["party.guests == ['Bob']"],
+                                                          OUT=["party.guests = ['Alice']"])),
+                                  ('arrive', dict(IN=['party', 'new arrival'], OUT=['arrival.who = ${name}'],
+                                                  MOD=['${name}= party.guests'])),
+                                  ('check', dict(IN=["arrival.who == 'Alice'"], OUT=[])))
+            suite.scenarios[2].steps[0].args = StepArguments([StepArgument('${name}', 'Bob', ArgKind.EMBEDDED)])
+            out_suite = SuiteProcessors().process_test_suite(suite, seed=seed)
+            self.assertEqual([s.name for s in out_suite.scenarios],
+                             ['start party', 'replace guests', 'arrive', 'check'])
+            self.assertEqual(out_suite.scenarios[2].steps[0].args[0].value, 'Alice')
+
+
+class TestRefinementCandidates(unittest.TestCase):
+    def test_only_scenarios_that_can_refine_are_tried_during_refinement(self):
+        suite = add_scenarios(Suite('party'),
+                              ('party', dict(IN=['new party', 'party.cake = False'], OUT=['party.cake == True'])),
+                              ('bake cake', dict(IN=['party.cake == False'], OUT=['party.cake = True'])),
+                              ('decorate', dict(IN=['party'], OUT=['party.balloons = True'])))
+        attempts = []
+
+        def fit(candidate, tracestate, *args):
+            attempts.append((candidate.name, tracestate.is_refinement_active()))
+            original_fit(candidate, tracestate, *args)
+        original_fit = modeller.try_to_fit_in_scenario
+        with patch.object(modeller, 'try_to_fit_in_scenario', side_effect=fit):
+            out_suite = SuiteProcessors().process_test_suite(suite, seed='party')
+        self.assertEqual([s.name for s in out_suite.scenarios][:3], ['party (part 1)', 'bake cake', 'party'])
+        self.assertIn(('bake cake', True), attempts)
+        self.assertNotIn(('decorate', True), attempts)
+
+
+class TestRefinementDepth(unittest.TestCase):
+    def setUp(self):
+        self.suite = add_scenarios(Suite('party'),
+                                   ('party', dict(IN=['new party', 'party.cake = False'],
+                                                  OUT=['party.cake == True'])),
+                                   ('bake cake', dict(IN=['party.cake == False', 'party.hot = False'],
+                                                      OUT=['party.hot == True', 'party.cake = True'])),
+                                   ('heat oven', dict(IN=['party.hot == False'], OUT=['party.hot = True'])))
+
+    def test_nested_refinements_are_unlimited_by_default(self):
+        out_suite = SuiteProcessors().process_test_suite(self.suite, seed='depth')
+        self.assertEqual([s.name for s in out_suite.scenarios],
+                         ['party (part 1)', 'bake cake (part 1)', 'heat oven', 'bake cake', 'party'])
+
+    def test_refinements_do_not_nest_beyond_max_refinement_depth(self):
+        self.assertRaises(Exception, SuiteProcessors().process_test_suite, self.suite, seed='depth',
+                          max_refinement_depth=1)
+        out_suite = SuiteProcessors().process_test_suite(self.suite, seed='depth', max_refinement_depth=2)
+        self.assertEqual(len(out_suite.scenarios), 5)
+
+    def test_max_refinement_depth_cannot_be_negative(self):
+        self.assertRaises(ValueError, SuiteProcessors().process_test_suite, self.suite, max_refinement_depth=-1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2026, J. Foederer
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+import pickle
+import unittest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+from robotmbt.suitedata import Suite
+from robotmbt.suitereplacer import SuiteReplacer, _model_fingerprint
+
+
+class TestBackgroundTraces(unittest.TestCase):
+    def setUp(self):
+        self.replacer = SuiteReplacer(pregenerate=True)
+        self.replacer.robot_suite = SimpleNamespace(id='s1')
+        self.model = Suite('model')
+
+    def collect(self, error):
+        future = Future()
+        future.set_exception(error)
+        self.replacer.background_traces['s1'] = (_model_fingerprint(self.model), {}, future)
+        return self.replacer._SuiteReplacer__collect_background_trace(self.model, {})
+
+    def test_failed_background_generation_falls_back_to_generating_again(self):
+        for error in [BrokenProcessPool('worker died'), pickle.PicklingError('cannot pickle'), TypeError('bad')]:
+            with self.subTest(error=error):
+                self.assertIsNone(self.collect(error))
+                self.assertEqual(self.replacer.background_traces, {})
+
+    def test_unsolvable_model_fails_right_away(self):
+        self.assertRaisesRegex(Exception, 'Unable to compose', self.collect,
+                               Exception("Unable to compose a consistent suite"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -31,6 +31,9 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import unittest
+from robotmbt.datacoverage import DataCoverage
+from robotmbt.modelspace import ModelSpace
+from robotmbt.substitutionmap import SubstitutionMap
 from robotmbt.tracestate import TraceState
 
 
@@ -512,6 +515,195 @@ class TestPartialScenarios(unittest.TestCase):
         ts.confirm_full_scenario(2, ScenarioStub('two remainder'), ModelStub())
         self.assertEqual(ts.coverage_drought, 0)
 
+    def test_commit_returns_newly_added_scenarios(self):
+        ts = TraceState([1, 2, 3])
+        ts.confirm_full_scenario(1, ScenarioStub('one'), ModelStub())
+        ts.confirm_full_scenario(2, ScenarioStub('two'), ModelStub())
+        self.assertEqual(ts.commit(), ['one', 'two'])
+        self.assertEqual(ts.commit(), [])
+        ts.confirm_full_scenario(3, ScenarioStub('three'), ModelStub())
+        self.assertEqual(ts.commit(), ['three'])
+        self.assertEqual(ts.get_trace(), ['one', 'two', 'three'])
+
+    def test_committed_scenarios_cannot_be_rewound(self):
+        ts = TraceState([1, 2])
+        ts.confirm_full_scenario(1, ScenarioStub('one'), ModelStub())
+        ts.commit()
+        self.assertIs(ts.can_rewind(), False)
+        ts.confirm_full_scenario(2, ScenarioStub('two'), ModelStub())
+        self.assertIs(ts.can_rewind(), True)
+        ts.rewind()
+        self.assertIs(ts.can_rewind(), False)
+        self.assertEqual(ts.get_trace(), ['one'])
+
+    def test_commit_stops_before_open_refinement(self):
+        ts = TraceState([1, 2, 3])
+        ts.confirm_full_scenario(1, ScenarioStub('one'), ModelStub())
+        ts.push_partial_scenario(2, ScenarioStub('two part1'), ModelStub())
+        ts.confirm_full_scenario(3, ScenarioStub('three'), ModelStub())
+        self.assertEqual(ts.commit(), ['one'])
+        self.assertEqual(ts.uncommitted, 2)
+        ts.confirm_full_scenario(2, ScenarioStub('two remainder'), ModelStub())
+        self.assertEqual(ts.commit(), ['two part1', 'three', 'two remainder'])
+
+    def test_commit_keeps_last_scenarios_open(self):
+        ts = TraceState([1, 2, 3])
+        for i in [1, 2, 3]:
+            ts.confirm_full_scenario(i, ScenarioStub(f'{i}'), ModelStub())
+        self.assertEqual(ts.commit(keep=2), ['1'])
+        self.assertEqual(ts.uncommitted, 2)
+        self.assertEqual(ts.commit(keep=2), [])
+
+    def test_commit_with_keep_does_not_split_refinement(self):
+        ts = TraceState([1, 2, 3])
+        ts.push_partial_scenario(1, ScenarioStub('one part1'), ModelStub())
+        ts.confirm_full_scenario(2, ScenarioStub('two'), ModelStub())
+        ts.confirm_full_scenario(1, ScenarioStub('one remainder'), ModelStub())
+        ts.confirm_full_scenario(3, ScenarioStub('three'), ModelStub())
+        self.assertEqual(ts.commit(keep=2), [])
+        self.assertEqual(ts.commit(keep=1), ['one part1', 'two', 'one remainder'])
+
+    def test_discarding_committed_scenarios_keeps_the_last_one(self):
+        ts = TraceState([1, 2, 3, 4])
+        for i in [1, 2, 3]:
+            ts.confirm_full_scenario(i, ScenarioStub(f'{i}'), ModelStub(last=i))
+        ts.commit()
+        ts.discard_committed()
+        self.assertEqual(ts.get_trace(), ['3'])
+        self.assertEqual(ts.model, dict(last=3))
+        self.assertIs(ts.can_rewind(), False)
+        self.assertEqual(ts.next_candidate(), 4)
+        ts.confirm_full_scenario(4, ScenarioStub('4'), ModelStub(last=4))
+        self.assertIs(ts.coverage_reached(), True)
+        ts.rewind()
+        self.assertEqual(ts.get_trace(), ['3'])
+        self.assertEqual(ts.tried, (4,))
+
+    def test_discarding_a_completed_refinement_keeps_the_tried_levels_aligned(self):
+        ts = TraceState([1, 2, 3, 4])
+        for _ in range(2):
+            ts.push_partial_scenario(1, ScenarioStub('one part1'), ModelStub())
+            ts.confirm_full_scenario(2, ScenarioStub('two'), ModelStub())
+            ts.confirm_full_scenario(1, ScenarioStub('one remainder'), ModelStub())
+            ts.confirm_full_scenario(3, ScenarioStub('three'), ModelStub(last=3))
+            ts.commit()
+            ts.discard_committed()
+        self.assertEqual(ts.get_trace(), ['three'])
+        ts.confirm_full_scenario(4, ScenarioStub('four'), ModelStub(last=4))
+        ts.rewind()
+        self.assertEqual(ts.get_trace(), ['three'])
+        self.assertEqual(ts.tried, (4,))
+
+    def test_trace_chunks_have_the_requested_size(self):
+        ts = TraceState([1, 2, 3, 4, 5])
+        for i in [1, 2, 3, 4, 5]:
+            ts.confirm_full_scenario(i, ScenarioStub(f'{i}'), ModelStub())
+        self.assertEqual(ts.get_trace_chunks(2), [['1', '2'], ['3', '4'], ['5']])
+        self.assertEqual(ts.get_trace_chunks(5), [['1', '2', '3', '4', '5']])
+
+    def test_trace_chunk_ends_before_refinement_that_does_not_fit(self):
+        ts = TraceState([1, 2, 3, 4])
+        ts.confirm_full_scenario(1, ScenarioStub('one'), ModelStub())
+        ts.push_partial_scenario(2, ScenarioStub('two part1'), ModelStub())
+        ts.confirm_full_scenario(3, ScenarioStub('three'), ModelStub())
+        ts.confirm_full_scenario(2, ScenarioStub('two remainder'), ModelStub())
+        ts.confirm_full_scenario(4, ScenarioStub('four'), ModelStub())
+        self.assertEqual(ts.get_trace_chunks(3), [['one'], ['two part1', 'three', 'two remainder'], ['four']])
+
+    def test_trace_chunk_grows_when_refinement_is_larger_than_chunk_size(self):
+        ts = TraceState([1, 2, 3])
+        ts.push_partial_scenario(1, ScenarioStub('one part1'), ModelStub())
+        ts.confirm_full_scenario(2, ScenarioStub('two'), ModelStub())
+        ts.confirm_full_scenario(1, ScenarioStub('one remainder'), ModelStub())
+        ts.confirm_full_scenario(3, ScenarioStub('three'), ModelStub())
+        self.assertEqual(ts.get_trace_chunks(2), [['one part1', 'two', 'one remainder'], ['three']])
+
+    def test_trace_is_segmented_where_the_model_is_empty(self):
+        in_use = ModelSpace()
+        in_use.add_prop('session')
+        ts = TraceState([1, 2, 3, 4])
+        ts.confirm_full_scenario(1, ScenarioStub('open'), in_use)
+        ts.confirm_full_scenario(2, ScenarioStub('close'), ModelSpace())
+        ts.confirm_full_scenario(3, ScenarioStub('open again'), in_use)
+        ts.confirm_full_scenario(4, ScenarioStub('use'), in_use)
+        self.assertEqual(ts.get_independent_segments(), [['open', 'close'], ['open again', 'use']])
+
+    def test_independent_segments_do_not_split_refinements(self):
+        ts = TraceState([1, 2])
+        ts.push_partial_scenario(1, ScenarioStub('one part1'), ModelSpace())
+        ts.confirm_full_scenario(2, ScenarioStub('two'), ModelSpace())
+        ts.confirm_full_scenario(1, ScenarioStub('one remainder'), ModelSpace())
+        self.assertEqual(ts.get_independent_segments(), [['one part1', 'two', 'one remainder']])
+
+    def test_sleeping_scenarios_are_skipped_at_their_position_only(self):
+        ts = TraceState([1, 2, 3])
+        ts.confirm_full_scenario(1, ScenarioStub('one'), ModelStub())
+        ts.put_to_sleep({2})
+        self.assertEqual(ts.sleeping, {2})
+        self.assertEqual(ts.next_candidate(), 3)
+        ts.confirm_full_scenario(3, ScenarioStub('three'), ModelStub())
+        self.assertEqual(ts.sleeping, set())
+        self.assertEqual(ts.next_candidate(), 2)
+        ts.rewind()
+        self.assertEqual(ts.sleeping, {2})
+        ts.rewind()
+        self.assertEqual(ts.sleeping, set())
+        self.assertEqual(ts.next_candidate(), 2)
+
+    def test_extended_trace_includes_the_model_data_of_both_traces(self):
+        light, door = ModelSpace(), ModelSpace()
+        light.add_prop('light')
+        door.add_prop('door')
+        ts = TraceState([1, 2, 3])
+        ts.confirm_full_scenario(1, ScenarioStub('install light'), light)
+        other = TraceState([2, 3])
+        other.push_partial_scenario(2, ScenarioStub('two part1'), door)
+        other.confirm_full_scenario(3, ScenarioStub('three'), door)
+        other.confirm_full_scenario(2, ScenarioStub('two remainder'), door)
+        ts.extend(other)
+        self.assertEqual(ts.id_trace, ['1', '2.1', '3', '2.0'])
+        self.assertEqual(ts.get_trace(), ['install light', 'two part1', 'three', 'two remainder'])
+        self.assertEqual(set(ts.model.props), {'light', 'door'})
+        self.assertIs(ts.coverage_reached(), True)
+
+
+class TestDataCoverage(unittest.TestCase):
+    @staticmethod
+    def variant(name, solution):
+        scenario = ScenarioStub(name)
+        scenario.data_choices = SubstitutionMap()
+        for example_value in solution:
+            scenario.data_choices.substitute(example_value, [1, 2])
+        scenario.data_choices.solution = solution
+        return scenario
+
+    def test_new_data_coverage_resets_the_drought(self):
+        ts = TraceState([1], DataCoverage(1))
+        ts.confirm_full_scenario(1, self.variant('one', {'A': 1}), ModelStub())
+        ts.confirm_full_scenario(1, self.variant('one', {'A': 1}), ModelStub())
+        self.assertEqual(ts.coverage_drought, 1)
+        ts.confirm_full_scenario(1, self.variant('one', {'A': 2}), ModelStub())
+        self.assertEqual(ts.coverage_drought, 0)
+
+    def test_data_coverage_is_only_needed_when_required(self):
+        ts = TraceState([1], DataCoverage(1))
+        ts.confirm_full_scenario(1, self.variant('one', {'A': 1}), ModelStub())
+        self.assertTrue(ts.coverage_reached())
+        ts.require_data_coverage()
+        self.assertFalse(ts.coverage_reached())
+        ts.confirm_full_scenario(1, self.variant('one', {'A': 2}), ModelStub())
+        self.assertTrue(ts.coverage_reached())
+
+    def test_rewinding_removes_data_coverage(self):
+        ts = TraceState([1], DataCoverage(1))
+        ts.require_data_coverage()
+        ts.confirm_full_scenario(1, self.variant('one', {'A': 1}), ModelStub())
+        ts.confirm_full_scenario(1, self.variant('one', {'A': 2}), ModelStub())
+        self.assertTrue(ts.coverage_reached())
+        ts.rewind()
+        self.assertFalse(ts.coverage_reached())
+        self.assertEqual(ts.data_coverage.status, (1, 2))
+
 
 class ScenarioStub(str):
     """Stub for suitedata.Scenario"""
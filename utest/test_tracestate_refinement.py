@@ -31,6 +31,8 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import unittest
+from robotmbt.modelspace import ModelSpace
+from robotmbt.suitedata import Scenario, Step
 from robotmbt.tracestate import TraceState
 
 
@@ -413,5 +415,50 @@ class TestTraceStateRefinement(unittest.TestCase):
         self.assertIsNone(ts.get_remainder(2))
 
 
+class TestRefinementLimits(unittest.TestCase):
+    @staticmethod
+    def remainder(text):
+        scenario = Scenario('remainder')
+        scenario.steps = [Step('Log    Refinement ready', parent=scenario), Step(text, parent=scenario)]
+        return scenario
+
+    @staticmethod
+    def model(value):
+        model = ModelSpace()
+        model.process_expression('new party')
+        model.process_expression(f'party.guests = {value}')
+        return model
+
+    def test_new_refinements_are_limited_by_max_refinement_depth(self):
+        ts = TraceState([1, 2, 3], max_refinement_depth=2)
+        ts.push_partial_scenario(1, 'one part1', self.model(0), self.remainder('When one'))
+        self.assertTrue(ts.refinement_allowed(2, self.model(0), self.remainder('When two')))
+        ts.push_partial_scenario(2, 'two part1', self.model(0), self.remainder('When two'))
+        self.assertFalse(ts.refinement_allowed(3, self.model(0), self.remainder('When three')))
+        ts.confirm_full_scenario(3, 'three', self.model(1))
+        self.assertTrue(ts.refinement_allowed(2, self.model(1), self.remainder('Then two')))
+
+    def test_refinements_are_unlimited_by_default(self):
+        ts = TraceState(range(10))
+        for i in range(9):
+            ts.push_partial_scenario(i, f'{i} part1', self.model(i), self.remainder(f'When {i}'))
+        self.assertTrue(ts.refinement_allowed(9, self.model(9), self.remainder('When 9')))
+
+    def test_repeated_refinement_without_new_coverage_is_a_cycle(self):
+        ts = TraceState([1, 2, 3, 4])
+        ts.push_partial_scenario(1, 'one part1', self.model(0), self.remainder('When one'))
+        ts.confirm_full_scenario(2, 'two', self.model(1))
+        ts.confirm_full_scenario(1, 'one', self.model(1))
+        self.assertTrue(ts.refinement_allowed(1, self.model(0), self.remainder('When one')))
+        ts.push_partial_scenario(1, 'one part1', self.model(0), self.remainder('When one'))
+        ts.confirm_full_scenario(2, 'two', self.model(1))
+        ts.confirm_full_scenario(1, 'one', self.model(1))
+        self.assertFalse(ts.refinement_allowed(1, self.model(0), self.remainder('When one')))
+        self.assertTrue(ts.refinement_allowed(1, self.model(2), self.remainder('When one')))
+        self.assertTrue(ts.refinement_allowed(1, self.model(0), self.remainder('When one again')))
+        ts.confirm_full_scenario(3, 'three', self.model(1))
+        self.assertTrue(ts.refinement_allowed(1, self.model(0), self.remainder('When one')))
+
+
 if __name__ == '__main__':
     unittest.main()